@@ -0,0 +1,173 @@
+"""
+Run level budget shared by the scoping, supervisor and research agents of one deep research run.
+
+The active budget lives in a context variable, so everything started inside
+`use_run_budget` (graph nodes, sub-agent tasks and tool threads) charges the same budget:
+
+    with use_run_budget(RunBudget(max_seconds=600, max_tokens=300_000, max_search_calls=40)):
+        scope = scope_research.invoke({"messages": [HumanMessage(content=request)]})
+        result = await supervisor_agent.ainvoke({...})
+"""
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing_extensions import Optional, Any
+import threading
+import time
+
+# Degradation levels, each one includes the measures of the previous levels
+BUDGET_OK = 0
+REDUCE_PARALLELISM = 1   # run a single research sub-agent per supervisor round
+SKIP_SUMMARIZATION = 2   # pass search snippets on instead of summarizing pages
+FORCE_COMPLETE = 3       # stop researching and compress what was found
+
+# Remaining budget fraction at which each level starts
+REDUCE_PARALLELISM_AT = 0.5
+SKIP_SUMMARIZATION_AT = 0.25
+FORCE_COMPLETE_AT = 0.1
+
+
+class RunBudget:
+    """Wall-clock, LLM token and search call limits for one deep research run.
+
+    Any limit left as None is not enforced. The remaining budget is the smallest
+    remaining fraction over all enforced limits.
+    """
+
+    def __init__(
+        self,
+        max_seconds: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        max_search_calls: Optional[int] = None,
+    ):
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+        self.max_search_calls = max_search_calls
+        self.started = time.monotonic()
+        self.tokens_used = 0
+        self.search_calls = 0
+        self._lock = threading.Lock()
+
+    def charge_tokens(self, tokens: int):
+        with self._lock:
+            self.tokens_used += tokens
+
+    def charge_search(self, calls: int = 1):
+        with self._lock:
+            self.search_calls += calls
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining_seconds(self) -> Optional[float]:
+        if self.max_seconds is None:
+            return None
+        return max(0.0, self.max_seconds - self.elapsed)
+
+    def remaining_fraction(self) -> float:
+        fractions = [1.0]
+        if self.max_seconds:
+            fractions.append(1 - self.elapsed / self.max_seconds)
+        if self.max_tokens:
+            fractions.append(1 - self.tokens_used / self.max_tokens)
+        if self.max_search_calls:
+            fractions.append(1 - self.search_calls / self.max_search_calls)
+        return max(0.0, min(fractions))
+
+    def level(self) -> int:
+        """Degradation level for the current remaining budget"""
+        remaining = self.remaining_fraction()
+        if remaining <= FORCE_COMPLETE_AT:
+            return FORCE_COMPLETE
+        if remaining <= SKIP_SUMMARIZATION_AT:
+            return SKIP_SUMMARIZATION
+        if remaining <= REDUCE_PARALLELISM_AT:
+            return REDUCE_PARALLELISM
+        return BUDGET_OK
+
+    def usage(self) -> dict:
+        return {
+            "seconds": round(self.elapsed, 2),
+            "tokens": self.tokens_used,
+            "search_calls": self.search_calls,
+            "remaining_fraction": round(self.remaining_fraction(), 3),
+        }
+
+
+_run_budget: ContextVar[Optional[RunBudget]] = ContextVar('run_budget', default=None)
+
+# Token count of the chat model calls inside a count_tokens block
+_token_counter: ContextVar[Optional[list]] = ContextVar('token_counter', default=None)
+
+
+def get_run_budget() -> Optional[RunBudget]:
+    """Budget of the run in the current context, None when the run is unbounded"""
+    return _run_budget.get()
+
+
+@contextmanager
+def use_run_budget(budget: RunBudget):
+    """Make `budget` the active budget for everything run inside the block"""
+    token = _run_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _run_budget.reset(token)
+
+
+def budget_level() -> int:
+    budget = get_run_budget()
+    return BUDGET_OK if budget is None else budget.level()
+
+
+def charge_search(calls: int = 1):
+    budget = get_run_budget()
+    if budget is not None:
+        budget.charge_search(calls)
+
+
+def charge_tokens(tokens: int):
+    budget = get_run_budget()
+    if budget is not None:
+        budget.charge_tokens(tokens)
+
+
+@contextmanager
+def count_tokens():
+    """Count the tokens the chat model calls inside the block report, yields a list holding the count"""
+    counter = [0]
+    token = _token_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _token_counter.reset(token)
+
+
+class BudgetCallbackHandler(BaseCallbackHandler):
+    """Charges the token usage reported by every chat model call to the active budget and token counter"""
+
+    run_inline = True
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        budget = get_run_budget()
+        counter = _token_counter.get()
+        if budget is None and counter is None:
+            return
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        tokens = usage.get('total_tokens')
+        if tokens is None:
+            tokens = sum(
+                (getattr(generation, 'message', None) and (generation.message.usage_metadata or {}).get('total_tokens', 0)) or 0
+                for generations in response.generations
+                for generation in generations
+            )
+        if counter is not None:
+            counter[0] += tokens or 0
+        if budget is not None:
+            budget.charge_tokens(tokens or 0)
+
+
+budget_callback = BudgetCallbackHandler()
@@ -0,0 +1,224 @@
+"""
+Record and replay of chat model and Tavily traffic for offline, deterministic runs.
+
+In record mode every ModelChain call and every Tavily search is written to a gzip
+compressed JSON lines cassette together with its latency. In replay mode the
+recorded responses are served back instead of calling the providers, either at the
+recorded speed or scaled (0 replays without any latency), so changes to the graph
+orchestration can be benchmarked against real traffic shapes.
+
+Enable for a whole process with DEEP_RESEARCH_CASSETTE=/path/run.jsonl.gz and
+DEEP_RESEARCH_CASSETTE_MODE=record|replay, or for a block of code with
+`use_cassette`. The cassette is process wide since provider calls hop between
+threads and event loops.
+
+Recorded calls are matched by a hash of their request, today's date is left out so
+cassettes replay on later days. Requests without an exact match get the next unused
+recording of the same kind and role, in recorded order.
+
+The tokens a recorded call used are stored with it and charged to the active run
+budget on replay, so budgeted runs degrade the same way as when they were recorded.
+"""
+
+from deep_research.utils import get_today_str
+from deep_research.budget import count_tokens, charge_tokens
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from pydantic import BaseModel
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing_extensions import Optional, Any, Callable, Awaitable
+from os import getenv
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+# Factor applied to recorded latencies on replay, 0 replays instantly
+default_latency_scale = float(getenv('DEEP_RESEARCH_CASSETTE_LATENCY', 1.0))
+
+
+class CassetteMiss(LookupError):
+    """Replay found no recording left for a request"""
+
+
+class ReplayedError(RuntimeError):
+    """A call that failed while recording fails the same way on replay"""
+
+
+def request_key(kind: str, scope: str, request: Any) -> str:
+    """Stable hash of a request, ignoring message and tool call ids and today's date"""
+    if isinstance(request, (list, tuple)) and all(isinstance(message, BaseMessage) for message in request):
+        request = [
+            {
+                "type": message.type,
+                "content": message.content,
+                "tool_calls": [
+                    {"name": call["name"], "args": call["args"]} for call in getattr(message, "tool_calls", None) or []
+                ],
+            }
+            for message in request
+        ]
+    elif isinstance(request, BaseMessage):
+        request = {"type": request.type, "content": request.content}
+    text = json.dumps([kind, scope, request], sort_keys=True, default=str).replace(get_today_str(), "")
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+def encode_response(response: Any) -> dict:
+    if isinstance(response, BaseMessage):
+        return {"type": "message", "value": message_to_dict(response)}
+    if isinstance(response, BaseModel):
+        return {"type": "model", "value": response.model_dump(mode="json")}
+    return {"type": "json", "value": response}
+
+
+def decode_response(encoded: dict, schema: Any = None) -> Any:
+    if encoded["type"] == "message":
+        return messages_from_dict([encoded["value"]])[0]
+    if encoded["type"] == "model" and isinstance(schema, type) and issubclass(schema, BaseModel):
+        return schema.model_validate(encoded["value"])
+    return encoded["value"]
+
+
+class Cassette:
+    """A recorded run of provider calls, either being written or being replayed"""
+
+    def __init__(self, path: str, mode: str = REPLAY, latency_scale: float = None):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode {mode}, expected '{RECORD}' or '{REPLAY}'")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = default_latency_scale if latency_scale is None else latency_scale
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = None
+        self.entries: list[dict] = []
+        self._by_key: dict[tuple, deque] = defaultdict(deque)
+        self._in_order: dict[tuple, deque] = defaultdict(deque)
+        self._used: set[int] = set()
+        if mode == RECORD:
+            self._file = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            self._load()
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as file:
+            try:
+                for line in file:
+                    if line.strip():
+                        self.entries.append(json.loads(line))
+            except (EOFError, gzip.BadGzipFile, json.JSONDecodeError):
+                # cassette of a recording that was killed, keep the complete entries
+                pass
+        for index, entry in enumerate(self.entries):
+            self._by_key[(entry["kind"], entry["scope"], entry["key"])].append(index)
+            self._in_order[(entry["kind"], entry["scope"])].append(index)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, kind: str, scope: str, key: str, start: float, latency: float, response: Any = None, error: Exception = None, tokens: int = 0):
+        entry = {"kind": kind, "scope": scope, "key": key, "start": round(start - self.started, 4), "latency": round(latency, 4)}
+        if tokens:
+            entry["tokens"] = tokens
+        if error is not None:
+            entry["error"] = f"{type(error).__name__}: {error}"
+        else:
+            entry["response"] = encode_response(response)
+        line = json.dumps(entry, default=str)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+
+    def _take(self, kind: str, scope: str, key: str) -> dict:
+        with self._lock:
+            for candidates in (self._by_key[(kind, scope, key)], self._in_order[(kind, scope)]):
+                while candidates:
+                    index = candidates.popleft()
+                    if index not in self._used:
+                        self._used.add(index)
+                        return self.entries[index]
+        raise CassetteMiss(f"No recorded {kind} call left for {scope} in {self.path}")
+
+    def _replayed(self, entry: dict, schema: Any) -> Any:
+        charge_tokens(entry.get("tokens", 0))
+        if "error" in entry:
+            raise ReplayedError(entry["error"])
+        return decode_response(entry["response"], schema)
+
+    def call(self, kind: str, scope: str, request: Any, call: Callable[[], Any], schema: Any = None) -> Any:
+        """Run `call` through the cassette, recording or replaying its response"""
+        key = request_key(kind, scope, request)
+        if self.mode == REPLAY:
+            entry = self._take(kind, scope, key)
+            if self.latency_scale > 0:
+                time.sleep(entry["latency"] * self.latency_scale)
+            return self._replayed(entry, schema)
+
+        start = time.monotonic()
+        with count_tokens() as tokens:
+            try:
+                response = call()
+            except Exception as e:
+                self._write(kind, scope, key, start, time.monotonic() - start, error=e, tokens=tokens[0])
+                raise
+        self._write(kind, scope, key, start, time.monotonic() - start, response, tokens=tokens[0])
+        return response
+
+    async def acall(self, kind: str, scope: str, request: Any, call: Callable[[], Awaitable[Any]], schema: Any = None) -> Any:
+        """Async version of `call`"""
+        key = request_key(kind, scope, request)
+        if self.mode == REPLAY:
+            entry = self._take(kind, scope, key)
+            if self.latency_scale > 0:
+                await asyncio.sleep(entry["latency"] * self.latency_scale)
+            return self._replayed(entry, schema)
+
+        start = time.monotonic()
+        with count_tokens() as tokens:
+            try:
+                response = await call()
+            except Exception as e:
+                self._write(kind, scope, key, start, time.monotonic() - start, error=e, tokens=tokens[0])
+                raise
+        self._write(kind, scope, key, start, time.monotonic() - start, response, tokens=tokens[0])
+        return response
+
+    def unused(self) -> int:
+        """Recordings not served yet during replay"""
+        with self._lock:
+            return len(self.entries) - len(self._used)
+
+
+_active_cassette: Optional[Cassette] = None
+if getenv('DEEP_RESEARCH_CASSETTE'):
+    _active_cassette = Cassette(getenv('DEEP_RESEARCH_CASSETTE'), getenv('DEEP_RESEARCH_CASSETTE_MODE', REPLAY))
+    atexit.register(_active_cassette.close)
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Active cassette, None when provider calls go straight to the providers"""
+    return _active_cassette
+
+
+@contextmanager
+def use_cassette(path: str, mode: str = REPLAY, latency_scale: float = None):
+    """Record or replay all provider calls made inside the block"""
+    global _active_cassette
+    previous = _active_cassette
+    cassette = Cassette(path, mode, latency_scale)
+    _active_cassette = cassette
+    try:
+        yield cassette
+    finally:
+        _active_cassette = previous
+        cassette.close()
@@ -0,0 +1,152 @@
+"""
+Local extractive summarizer used instead of the summarization model for short or
+low ranked webpages.
+
+Sentences are scored with TF-IDF vectors by a mix of TextRank centrality and
+similarity to the search query, and the best ones are returned in the same
+<summary>/<key_excerpts> format as the model summaries.
+"""
+
+from deep_research.utils import tokenize
+from typing_extensions import Optional
+import numpy as np
+import re
+
+# Sentences considered per page, the similarity matrix is quadratic in this
+max_sentences_scored = 300
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])|\n{2,}|\n(?=[-*•#\d])")
+
+
+def split_sentences(text: str) -> list[str]:
+    """Split page text into sentences, dropping navigation crumbs and very short fragments"""
+    sentences = []
+    for sentence in _SENTENCE_END.split(text):
+        sentence = " ".join(sentence.split())
+        if len(sentence) >= 25 and len(tokenize(sentence)) >= 3:
+            sentences.append(sentence)
+    return sentences
+
+
+def tfidf_matrix(documents: list[list[str]], vocabulary: Optional[dict] = None) -> tuple[np.ndarray, dict]:
+    """L2 normalized TF-IDF rows for tokenized documents, and the vocabulary used"""
+    if vocabulary is None:
+        vocabulary = {}
+        for tokens in documents:
+            for token in tokens:
+                vocabulary.setdefault(token, len(vocabulary))
+
+    counts = np.zeros((len(documents), max(len(vocabulary), 1)), dtype=np.float32)
+    for row, tokens in enumerate(documents):
+        for token in tokens:
+            column = vocabulary.get(token)
+            if column is not None:
+                counts[row, column] += 1
+
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+    weights = np.log1p(counts) * idf
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    return weights / np.where(norms == 0, 1, norms), vocabulary
+
+
+def textrank(similarity: np.ndarray, damping: float = 0.85, iterations: int = 30) -> np.ndarray:
+    """PageRank over the sentence similarity graph"""
+    n = similarity.shape[0]
+    graph = similarity.copy()
+    np.fill_diagonal(graph, 0)
+    row_sums = graph.sum(axis=1, keepdims=True)
+    transition = np.where(row_sums == 0, 1 / n, graph / np.where(row_sums == 0, 1, row_sums))
+    scores = np.full(n, 1 / n)
+    for _ in range(iterations):
+        scores = (1 - damping) / n + damping * transition.T @ scores
+    return scores
+
+
+def score_sentences(sentences: list[str], query: Optional[str] = None) -> tuple[np.ndarray, np.ndarray]:
+    """Return (overall score, query relevance) for every sentence"""
+    tokens = [tokenize(sentence) for sentence in sentences]
+    vectors, vocabulary = tfidf_matrix(tokens)
+
+    centrality = textrank(vectors @ vectors.T)
+    centrality = centrality / centrality.max() if centrality.max() > 0 else centrality
+
+    relevance = np.zeros(len(sentences))
+    if query:
+        query_vector, _ = tfidf_matrix([tokenize(query)], vocabulary)
+        relevance = vectors @ query_vector[0]
+        if relevance.max() > 0:
+            relevance = relevance / relevance.max()
+
+    # pages tend to lead with their most important content
+    position = 1 - np.arange(len(sentences)) / max(len(sentences), 1)
+    if query and relevance.any():
+        scores = 0.45 * centrality + 0.45 * relevance + 0.1 * position
+    else:
+        scores = 0.85 * centrality + 0.15 * position
+    return scores, relevance
+
+
+def extractive_summary(
+    webpage_content: str,
+    query: Optional[str] = None,
+    max_summary_sentences: int = 5,
+    max_excerpts: int = 3,
+    max_excerpt_chars: int = 300,
+) -> str:
+    """Summarize webpage content locally by picking its most central and query relevant sentences.
+
+    Args:
+        webpage_content: Raw webpage content to summarize
+        query: Search query the page was retrieved for, used to rank sentences
+        max_summary_sentences: Sentences kept for the summary
+        max_excerpts: Sentences quoted as key excerpts
+        max_excerpt_chars: Maximum length of a single excerpt
+
+    Returns:
+        Formatted summary with key excerpts, in the same format as the model summaries
+    """
+    sentences = split_sentences(webpage_content)[:max_sentences_scored]
+    if not sentences:
+        text = " ".join(webpage_content.split())
+        text = text[:1000] + "..." if len(text) > 1000 else text
+        return f"<summary>\n{text}\n</summary>\n\n<key_excerpts>\n\n</key_excerpts>"
+
+    scores, relevance = score_sentences(sentences, query)
+
+    summary_indices = sorted(np.argsort(-scores)[:max_summary_sentences])
+    summary = " ".join(sentences[i] for i in summary_indices)
+
+    excerpt_order = np.argsort(-(relevance if relevance.any() else scores))
+    excerpts = []
+    for i in excerpt_order[:max_excerpts]:
+        sentence = sentences[i]
+        if len(sentence) > max_excerpt_chars:
+            sentence = sentence[:max_excerpt_chars].rsplit(" ", 1)[0] + "..."
+        excerpts.append(f'"{sentence}"')
+
+    key_excerpts = "\n".join(excerpts)
+    return (
+        f"<summary>\n{summary}\n</summary>\n\n"
+        f"<key_excerpts>\n{key_excerpts}\n</key_excerpts>"
+    )
+
+
+def extractive_digest(text: str, query: Optional[str] = None, max_sentences: int = 3, max_chars: int = 600) -> str:
+    """Short plain text digest of the most central and query relevant sentences, in their original order.
+
+    Args:
+        text: Text to digest
+        query: Topic the text is about, used to rank sentences
+        max_sentences: Sentences kept
+        max_chars: Maximum length of the digest
+
+    Returns:
+        Digest of at most max_chars characters
+    """
+    sentences = split_sentences(text)[:max_sentences_scored]
+    if sentences:
+        scores, _ = score_sentences(sentences, query)
+        text = " ".join(sentences[i] for i in sorted(np.argsort(-scores)[:max_sentences]))
+    text = " ".join(text.split())
+    return text[:max_chars].rsplit(" ", 1)[0] + "..." if len(text) > max_chars else text
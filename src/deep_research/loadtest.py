@@ -0,0 +1,394 @@
+"""
+Load test harness for supervisor_agent against simulated providers.
+
+The chat models of every ModelChain and the Tavily client are swapped for local
+stand-ins with log-normal latencies, per model rate limits answered with simulated
+429s and random provider errors. The ModelChain fallback, cooldown and hedging
+logic keeps running on top of them. Many supervisor runs are executed concurrently
+for each point of a sweep over the concurrency settings, and every point reports
+throughput, run latency percentiles, provider call rate and peak memory.
+
+    python -m deep_research.loadtest --runs 32 --concurrency 1,4,16 --researchers 1,3,5 --time-scale 0.01
+
+Latencies and rate limits are given in real time and scaled by --time-scale, so a
+sweep finishes quickly while keeping the shape of the traffic.
+"""
+
+from deep_research.research_state import LLMOutput, Summary
+from deep_research.state_multi_agent_supervisor import SupervisorOutput
+from deep_research.state_scope import ClarifyWithUser, ResearchQuestion
+from deep_research.openrouter import ModelChain
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+from collections import defaultdict, deque
+from contextlib import contextmanager, redirect_stdout, nullcontext
+from dataclasses import dataclass, field, asdict
+from typing_extensions import Optional, Any
+import argparse
+import asyncio
+import io
+import json
+import math
+import random
+import threading
+import time
+import tracemalloc
+import httpx
+import openai
+
+# Median seconds and log-normal sigma of one call per role, 'search' is a Tavily search
+default_latencies = {
+    'supervisor': (4.0, 0.5),
+    'researcher': (3.0, 0.5),
+    'compressor': (8.0, 0.4),
+    'summarizer': (2.0, 0.6),
+    'scoper': (2.0, 0.4),
+    'search': (1.5, 0.5),
+}
+
+vocabulary = (
+    "market growth energy battery storage policy cost adoption supply chain demand research study "
+    "report analysis data trend forecast capacity price investment region sector technology impact"
+).split()
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile, 0 for no values"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+@dataclass
+class ProviderProfile:
+    """Behaviour of the simulated providers"""
+    latencies: dict = field(default_factory=lambda: dict(default_latencies))
+    # Requests per second each model accepts before answering 429, None for no limit
+    model_rps_limit: Optional[float] = 2.0
+    # Share of requests failing with a 429 regardless of load
+    error_rate: float = 0.02
+    time_scale: float = 1.0
+    topics_per_round: int = 3
+    supervisor_rounds: int = 2
+    searches_per_researcher: int = 2
+    page_chars: int = 6000
+    seed: int = 0
+
+
+class SimulatedProvider:
+    """Stand-in for OpenRouter and Tavily which keeps call statistics"""
+
+    def __init__(self, profile: ProviderProfile):
+        self.profile = profile
+        self.random = random.Random(profile.seed)
+        self.calls: dict[str, int] = defaultdict(int)
+        self.rate_limited = 0
+        self._recent: dict[str, deque] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def latency(self, role: str) -> float:
+        median, sigma = self.profile.latencies.get(role, (1.0, 0.5))
+        with self._lock:
+            return median * math.exp(self.random.gauss(0, sigma)) * self.profile.time_scale
+
+    def admit(self, model_name: str, role: str):
+        """Count a request and raise a simulated 429 when the model is over its rate limit"""
+        now = time.monotonic()
+        window = self.profile.time_scale
+        with self._lock:
+            self.calls[role] += 1
+            recent = self._recent[model_name]
+            while recent and recent[0] < now - window:
+                recent.popleft()
+            limited = (
+                (self.profile.model_rps_limit is not None and len(recent) >= self.profile.model_rps_limit)
+                or self.random.random() < self.profile.error_rate
+            )
+            recent.append(now)
+            if limited:
+                self.rate_limited += 1
+        if limited:
+            request = httpx.Request('POST', f'https://simulated/{model_name}/chat/completions')
+            raise openai.RateLimitError(
+                f'Simulated rate limit for {model_name}',
+                response=httpx.Response(429, request=request, headers={'retry-after': '1'}),
+                body=None,
+            )
+
+    def page(self, query: str, index: int) -> str:
+        words = query.split() + vocabulary
+        with self._lock:
+            sentences = [
+                " ".join(self.random.choice(words) for _ in range(14)).capitalize() + "."
+                for _ in range(self.profile.page_chars // 100 + 1)
+            ]
+        return f"{query} source {index}. " + " ".join(sentences)
+
+    def respond(self, role: str, schema: Any, messages: list) -> Any:
+        """Plausible reply of `role` for the conversation so far"""
+        tool_messages = sum(1 for message in messages if getattr(message, "type", None) == "tool")
+        topic = next((str(message.content) for message in messages if getattr(message, "type", None) == "human"), "")
+        if schema is SupervisorOutput:
+            rounds = sum(1 for message in messages if getattr(message, "type", None) == "ai")
+            if rounds >= self.profile.supervisor_rounds:
+                return SupervisorOutput(message="Research is complete", tool_calls=[{"name": "ResearchComplete", "args": {}, "id": f"complete-{rounds}"}])
+            return SupervisorOutput(message=f"Round {rounds}", tool_calls=[
+                {"name": "ConductResearch", "args": {"research_topic": f"{topic[:200]} aspect {rounds}.{i}"}, "id": f"research-{rounds}-{i}"}
+                for i in range(self.profile.topics_per_round)
+            ])
+        if schema is LLMOutput:
+            if tool_messages >= self.profile.searches_per_researcher:
+                return LLMOutput(tool_calls=[], research_message="Enough sources were found")
+            return LLMOutput(tool_calls=[
+                {"name": "tavily_search", "args": {"query": f"{topic[:120]} {tool_messages}"}, "id": f"search-{tool_messages}"}
+            ], research_message="Searching")
+        if schema is Summary:
+            return Summary(summary=" ".join(vocabulary[:40]), key_excerpts=" ".join(vocabulary[:20]))
+        if schema is ClarifyWithUser:
+            return ClarifyWithUser(need_clarification=False, question="", verification="Starting research")
+        if schema is ResearchQuestion:
+            return ResearchQuestion(research_brief=topic)
+        return AIMessage(content=f"Findings on {topic[:200]}: " + " ".join(vocabulary * 10))
+
+    def search(self, query: str, max_results: int = 3, topic: str = 'general', include_raw_content: bool = True, **kwargs) -> dict:
+        with self._lock:
+            self.calls['search'] += 1
+        time.sleep(self.latency('search'))
+        return {"query": query, "results": [
+            {
+                "url": f"https://simulated.example/{abs(hash(query)) % 100000}/{i}",
+                "title": f"{query[:60]} result {i}",
+                "content": f"{query} snippet {i}",
+                "raw_content": self.page(query, i) if include_raw_content else None,
+                "score": round(0.9 - 0.1 * i, 2),
+            }
+            for i in range(max_results)
+        ]}
+
+
+class SimulatedChatModel:
+    """Chat model stand-in for one model of a ModelChain"""
+
+    def __init__(self, provider: SimulatedProvider, name: str, role: str):
+        self.provider = provider
+        self.name = name
+        self.role = role
+
+    def _reply(self, messages: Any, schema: Any = None, include_raw: bool = False) -> Any:
+        messages = messages if isinstance(messages, list) else [HumanMessage(content=str(messages))]
+        parsed = self.provider.respond(self.role, schema, messages)
+        if schema is not None and include_raw:
+            return {"raw": AIMessage(content=""), "parsed": parsed, "parsing_error": None}
+        return parsed
+
+    def invoke(self, input: Any, config: Optional[dict] = None, schema: Any = None, include_raw: bool = False, **kwargs) -> Any:
+        self.provider.admit(self.name, self.role)
+        time.sleep(self.provider.latency(self.role))
+        return self._reply(input, schema, include_raw)
+
+    async def ainvoke(self, input: Any, config: Optional[dict] = None, schema: Any = None, include_raw: bool = False, **kwargs) -> Any:
+        self.provider.admit(self.name, self.role)
+        await asyncio.sleep(self.provider.latency(self.role))
+        return self._reply(input, schema, include_raw)
+
+    def with_structured_output(self, schema: Any, include_raw: bool = False, **kwargs) -> RunnableLambda:
+        return RunnableLambda(
+            lambda input: self.invoke(input, schema=schema, include_raw=include_raw),
+            afunc=lambda input: self.ainvoke(input, schema=schema, include_raw=include_raw),
+        )
+
+
+def model_chains() -> list[ModelChain]:
+    """Every ModelChain used by the research graphs"""
+    from deep_research import research_agent, research_supervisor, scope_research, tavily
+    return [research_agent.model, research_agent.compress_model, research_supervisor.supervisor_model,
+            scope_research.model, tavily.summary_model]
+
+
+@contextmanager
+def simulated_providers(provider: SimulatedProvider):
+    """Route all chat model and Tavily calls to `provider` inside the block.
+
+    The block starts from empty search and summary caches, in-flight maps and
+    latency windows, so one measured point does not profit from the work of the
+    previous one, and the real ones are restored afterwards.
+    """
+    from deep_research import tavily
+    from deep_research.openrouter import LatencyTracker, HEDGE_BURST
+    chains = model_chains()
+    saved = [(chain, chain.models, list(chain._unhealthy_until), chain.latency, chain._hedge_tokens) for chain in chains]
+    shared_state = ('summary_cache', 'prefetched_searches', 'prefetch_stats', 'search_flight', 'summary_flight')
+    saved_state = {name: getattr(tavily, name) for name in shared_state}
+    saved_client = tavily.tavily_client
+    for chain in chains:
+        chain.models = [SimulatedChatModel(provider, name, chain.role) for name in chain.model_names]
+        chain._unhealthy_until = [0.0] * len(chain.models)
+        chain.latency = LatencyTracker()
+        chain._hedge_tokens = float(HEDGE_BURST)
+    for name in shared_state:
+        setattr(tavily, name, type(saved_state[name])())
+    tavily.tavily_client = provider
+    try:
+        yield provider
+    finally:
+        for chain, models, unhealthy_until, latency, hedge_tokens in saved:
+            chain.models = models
+            chain._unhealthy_until = unhealthy_until
+            chain.latency = latency
+            chain._hedge_tokens = hedge_tokens
+        for name, value in saved_state.items():
+            setattr(tavily, name, value)
+        tavily.tavily_client = saved_client
+
+
+@dataclass
+class LoadPoint:
+    concurrency: int
+    max_concurrent_researchers: int
+    max_researcher_iterations: int
+    runs: int = 0
+    failed: int = 0
+    wall_seconds: float = 0.0
+    throughput_per_minute: float = 0.0
+    p50_seconds: float = 0.0
+    p95_seconds: float = 0.0
+    p99_seconds: float = 0.0
+    provider_calls: int = 0
+    provider_calls_per_second: float = 0.0
+    rate_limited: int = 0
+    searches: int = 0
+    peak_memory_mb: float = 0.0
+
+
+async def run_point(
+    profile: ProviderProfile,
+    runs: int,
+    concurrency: int,
+    max_concurrent_researchers: int,
+    max_researcher_iterations: int,
+) -> LoadPoint:
+    """Execute `runs` supervisor runs with at most `concurrency` in flight and measure them"""
+    from deep_research import research_supervisor
+
+    point = LoadPoint(concurrency, max_concurrent_researchers, max_researcher_iterations)
+    provider = SimulatedProvider(profile)
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(index: int):
+        async with limit:
+            brief = f"Research brief {index}: {' '.join(random.Random(index).sample(vocabulary, 5))}"
+            started = time.monotonic()
+            try:
+                await research_supervisor.supervisor_agent.ainvoke({
+                    "supervisor_messages": [HumanMessage(content=brief)],
+                    "research_brief": brief,
+                })
+                latencies.append(time.monotonic() - started)
+            except Exception as e:
+                print(f"Load test run {index} failed: {e}")
+                point.failed += 1
+
+    saved = (research_supervisor.max_concurrent_researchers, research_supervisor.max_researcher_iterations)
+    research_supervisor.max_concurrent_researchers = max_concurrent_researchers
+    research_supervisor.max_researcher_iterations = max_researcher_iterations
+    tracemalloc.reset_peak()
+    started = time.monotonic()
+    try:
+        with simulated_providers(provider):
+            await asyncio.gather(*(one(index) for index in range(runs)))
+    finally:
+        research_supervisor.max_concurrent_researchers, research_supervisor.max_researcher_iterations = saved
+
+    point.wall_seconds = time.monotonic() - started
+    point.runs = len(latencies)
+    point.throughput_per_minute = 60 * point.runs / point.wall_seconds
+    point.p50_seconds = percentile(latencies, 0.5)
+    point.p95_seconds = percentile(latencies, 0.95)
+    point.p99_seconds = percentile(latencies, 0.99)
+    point.searches = provider.calls.get('search', 0)
+    point.provider_calls = sum(provider.calls.values()) - point.searches
+    point.provider_calls_per_second = point.provider_calls / point.wall_seconds
+    point.rate_limited = provider.rate_limited
+    point.peak_memory_mb = tracemalloc.get_traced_memory()[1] / 2**20
+    return point
+
+
+async def sweep(
+    profile: ProviderProfile,
+    runs: int,
+    concurrency: list[int],
+    researchers: list[int],
+    iterations: list[int],
+    quiet: bool = True,
+) -> list[LoadPoint]:
+    """Run every combination of the concurrency settings"""
+    points = []
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        for runs_in_flight in concurrency:
+            for max_researchers in researchers:
+                for max_iterations in iterations:
+                    output = io.StringIO()
+                    with redirect_stdout(output) if quiet else nullcontext():
+                        point = await run_point(profile, runs, runs_in_flight, max_researchers, max_iterations)
+                    points.append(point)
+                    print(format_point(point))
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return points
+
+
+def format_point(point: LoadPoint) -> str:
+    return (
+        f"concurrency={point.concurrency:<4} researchers={point.max_concurrent_researchers:<3} "
+        f"iterations={point.max_researcher_iterations:<3} runs={point.runs}/{point.runs + point.failed} "
+        f"throughput={point.throughput_per_minute:8.1f}/min p50={point.p50_seconds:7.2f}s "
+        f"p95={point.p95_seconds:7.2f}s p99={point.p99_seconds:7.2f}s "
+        f"calls={point.provider_calls_per_second:6.1f}/s 429s={point.rate_limited:<5} "
+        f"searches={point.searches:<5} peak_memory={point.peak_memory_mb:7.1f}MB"
+    )
+
+
+def int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep supervisor concurrency settings against simulated providers")
+    parser.add_argument("--runs", type=int, default=16, help="Supervisor runs per sweep point")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4, 16], help="Supervisor runs in flight, comma separated")
+    parser.add_argument("--researchers", type=int_list, default=[1, 3, 5], help="max_concurrent_researchers values")
+    parser.add_argument("--iterations", type=int_list, default=[6], help="max_researcher_iterations values")
+    parser.add_argument("--topics-per-round", type=int, default=3)
+    parser.add_argument("--supervisor-rounds", type=int, default=2)
+    parser.add_argument("--searches-per-researcher", type=int, default=2)
+    parser.add_argument("--rps-limit", type=float, default=2.0, help="Requests per second per model before 429s, 0 for none")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="Share of requests failing with a 429 at any load")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="Factor applied to simulated latencies")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the research graphs")
+    args = parser.parse_args()
+
+    profile = ProviderProfile(
+        model_rps_limit=args.rps_limit or None,
+        error_rate=args.error_rate,
+        time_scale=args.time_scale,
+        topics_per_round=args.topics_per_round,
+        supervisor_rounds=args.supervisor_rounds,
+        searches_per_researcher=args.searches_per_researcher,
+        seed=args.seed,
+    )
+    points = asyncio.run(sweep(profile, args.runs, args.concurrency, args.researchers, args.iterations, quiet=not args.verbose))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({"profile": asdict(profile), "points": [asdict(point) for point in points]}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
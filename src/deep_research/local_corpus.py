@@ -0,0 +1,304 @@
+"""
+Local document corpus searched with SQLite FTS5, an offline retrieval backend next to Tavily.
+
+Text, markdown and HTML files under a directory are split into passages and
+indexed in an FTS5 table. Re-indexing is incremental: only files whose size or
+modification time changed are read again, files whose content hash did not change
+are left alone and deleted files are dropped. Searches return results in the
+Tavily response shape, so they go through the same ranking, summarization and
+formatting as web searches.
+
+    python -m deep_research.local_corpus /path/to/documents "query to try"
+
+Set DEEP_RESEARCH_CORPUS_DIR to give the research agents the local_search tool.
+"""
+
+from deep_research.notes_index import split_passages
+from deep_research.utils import tokenize
+from html.parser import HTMLParser
+from typing_extensions import Optional
+from os import getenv
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# Directory of documents searched by the local_search tool, unset to disable it
+corpus_dir = getenv('DEEP_RESEARCH_CORPUS_DIR')
+
+# SQLite database holding the corpus index
+corpus_db_path = getenv(
+    'DEEP_RESEARCH_CORPUS_DB',
+    os.path.join(os.path.expanduser('~'), '.cache', 'deep_research', 'corpus.sqlite')
+)
+
+# Seconds between checks of the directory for changed files
+corpus_refresh_interval = 300
+
+# File types indexed, by extension
+corpus_extensions = ('.txt', '.md', '.markdown', '.rst', '.html', '.htm')
+
+# Passages returned per document and the characters of matching passages passed on as raw content
+passages_per_result = 3
+max_raw_content_chars = 8000
+
+
+class _TextExtractor(HTMLParser):
+    """Visible text and title of an HTML document"""
+
+    skipped_tags = {'script', 'style', 'noscript', 'template', 'svg', 'head'}
+    block_tags = {'p', 'div', 'br', 'li', 'tr', 'section', 'article', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'blockquote'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.title = ""
+        self._skipping = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title':
+            self._in_title = True
+        elif tag in self.skipped_tags:
+            self._skipping += 1
+        elif tag in self.block_tags:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self._in_title = False
+        elif tag in self.skipped_tags:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self.block_tags:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skipping:
+            self.parts.append(data)
+
+
+def read_document(path: str) -> tuple[str, str]:
+    """Return (title, text) of a text, markdown or HTML file"""
+    with open(path, encoding='utf-8', errors='ignore') as file:
+        content = file.read()
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    if path.lower().endswith(('.html', '.htm')):
+        extractor = _TextExtractor()
+        extractor.feed(content)
+        text = "\n".join(" ".join(line.split()) for line in "".join(extractor.parts).split("\n"))
+        return " ".join(extractor.title.split()) or name, text
+
+    for line in content.splitlines():
+        if line.startswith('#'):
+            return line.lstrip('#').strip() or name, content
+        if line.strip():
+            break
+    return name, content
+
+
+class LocalCorpus:
+    """FTS5 index of the documents under `root`, safe to share between threads"""
+
+    def __init__(self, root: str, path: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        self.path = path or corpus_db_path
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # held for a whole index pass, so parallel searches do not each walk and re-index the corpus
+        self._index_lock = threading.Lock()
+        self.indexed_at = 0.0
+        # documents of this corpus are selected by path prefix, one database may hold several roots
+        prefix = self.root.rstrip(os.sep) + os.sep
+        self._prefix_args = (len(prefix), prefix)
+        try:
+            with self._lock, self._connection:
+                self._connection.execute("""
+                    CREATE TABLE IF NOT EXISTS documents (
+                        path TEXT PRIMARY KEY,
+                        title TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        mtime REAL NOT NULL,
+                        sha256 TEXT NOT NULL
+                    )
+                """)
+                self._connection.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5("
+                    "path UNINDEXED, title, text, tokenize = 'porter unicode61')"
+                )
+        except sqlite3.OperationalError as e:
+            raise RuntimeError(f"SQLite FTS5 is required for the local corpus: {e}")
+
+    def _files(self) -> dict[str, os.stat_result]:
+        files = {}
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.lower().endswith(corpus_extensions):
+                    path = os.path.join(directory, name)
+                    try:
+                        files[path] = os.stat(path)
+                    except OSError:
+                        continue
+        return files
+
+    def index(self) -> dict:
+        """Bring the index up to date with the directory, returns counts of the changes"""
+        with self._index_lock:
+            return self._index()
+
+    def _index(self) -> dict:
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        files = self._files()
+        with self._lock:
+            known = {
+                path: (size, mtime, sha256) for path, size, mtime, sha256 in
+                self._connection.execute("SELECT path, size, mtime, sha256 FROM documents WHERE substr(path, 1, ?) = ?", self._prefix_args)
+            }
+        for path in known.keys() - files.keys():
+            with self._lock, self._connection:
+                self._connection.execute("DELETE FROM passages WHERE path = ?", (path,))
+                self._connection.execute("DELETE FROM documents WHERE path = ?", (path,))
+            stats["removed"] += 1
+
+        for path, stat in files.items():
+            if path in known and known[path][:2] == (stat.st_size, stat.st_mtime):
+                stats["unchanged"] += 1
+                continue
+            try:
+                title, text = read_document(path)
+            except OSError as e:
+                print(f"Could not index {path}: {e}")
+                continue
+            digest = hashlib.sha256(text.encode('utf-8', errors='ignore')).hexdigest()
+            with self._lock, self._connection:
+                if path in known and known[path][2] == digest:
+                    # touched but not changed, only remember the new size and time
+                    self._connection.execute("UPDATE documents SET size = ?, mtime = ? WHERE path = ?", (stat.st_size, stat.st_mtime, path))
+                    stats["unchanged"] += 1
+                    continue
+                self._connection.execute("DELETE FROM passages WHERE path = ?", (path,))
+                self._connection.executemany(
+                    "INSERT INTO passages (path, title, text) VALUES (?, ?, ?)",
+                    [(path, title, passage) for passage in split_passages(text)]
+                )
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO documents (path, title, size, mtime, sha256) VALUES (?, ?, ?, ?, ?)",
+                    (path, title, stat.st_size, stat.st_mtime, digest)
+                )
+            stats["updated" if path in known else "added"] += 1
+        self.indexed_at = time.time()
+        return stats
+
+    def refresh(self, max_age: float = None):
+        """Re-index when the last indexing is older than max_age seconds.
+
+        Only one index pass runs at a time. Callers arriving during the first
+        pass wait for it, during later passes they search the current index.
+        """
+        max_age = corpus_refresh_interval if max_age is None else max_age
+        if time.time() - self.indexed_at <= max_age:
+            return
+        if not self._index_lock.acquire(blocking=not self.indexed_at):
+            return
+        try:
+            # another caller may have finished a pass while this one waited
+            if time.time() - self.indexed_at > max_age:
+                self._index()
+        finally:
+            self._index_lock.release()
+
+    def search(self, query: str, max_results: int = 3, topic: str = 'general', include_raw_content: bool = True) -> dict:
+        """Search the corpus, returning documents in the Tavily response shape.
+
+        Args:
+            query: Search query, matched on any of its words and ranked with BM25
+            max_results: Maximum number of documents
+            topic: Accepted for compatibility with Tavily, not used
+            include_raw_content: Whether to include the matching passages as raw content
+
+        Returns:
+            {'query': query, 'results': [{'url', 'title', 'content', 'raw_content', 'score'}]}
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return {"query": query, "results": []}
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT path, title, text, bm25(passages) FROM passages WHERE passages MATCH ? "
+                "AND substr(path, 1, ?) = ? ORDER BY bm25(passages) LIMIT ?",
+                (match, *self._prefix_args, max_results * passages_per_result * 4)
+            ).fetchall()
+
+        documents: dict[str, dict] = {}
+        for path, title, text, rank in rows:
+            document = documents.get(path)
+            if document is None:
+                if len(documents) >= max_results:
+                    continue
+                # FTS5 ranks lower is better, negated to a positive relevance
+                document = documents[path] = {"title": title, "passages": [], "relevance": -rank}
+            if len(document["passages"]) < passages_per_result:
+                document["passages"].append(text)
+
+        best = max((document["relevance"] for document in documents.values()), default=0) or 1.0
+        results = []
+        for path, document in documents.items():
+            raw_content = "\n\n".join(document["passages"])[:max_raw_content_chars]
+            results.append({
+                "url": "file://" + path,
+                "title": document["title"],
+                "content": document["passages"][0][:500],
+                "raw_content": raw_content if include_raw_content else None,
+                "score": round(document["relevance"] / best, 4),
+            })
+        return {"query": query, "results": results}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM documents WHERE substr(path, 1, ?) = ?", self._prefix_args).fetchone()[0]
+
+
+_local_corpus: Optional[LocalCorpus] = None
+_local_corpus_lock = threading.Lock()
+
+
+def get_local_corpus() -> Optional[LocalCorpus]:
+    """Shared corpus of corpus_dir, None when no corpus is configured"""
+    global _local_corpus
+    if not corpus_dir:
+        return None
+    with _local_corpus_lock:
+        if _local_corpus is None:
+            _local_corpus = LocalCorpus(corpus_dir)
+        return _local_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index a document directory for local search and optionally query it")
+    parser.add_argument("root", help="Directory of text, markdown and HTML documents")
+    parser.add_argument("query", nargs="?", help="Query to run after indexing")
+    parser.add_argument("--db", default=corpus_db_path, help="Path of the SQLite index")
+    parser.add_argument("--max-results", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = LocalCorpus(args.root, args.db)
+    started = time.monotonic()
+    stats = corpus.index()
+    print(f"Indexed {len(corpus)} documents in {time.monotonic() - started:.2f}s: {stats}")
+    if args.query:
+        started = time.monotonic()
+        response = corpus.search(args.query, max_results=args.max_results)
+        print(f"{len(response['results'])} results in {1000 * (time.monotonic() - started):.1f}ms")
+        for result in response['results']:
+            print(f"{result['score']:.3f}  {result['title']}  {result['url']}")
+
+
+if __name__ == "__main__":
+    main()
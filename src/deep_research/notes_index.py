@@ -0,0 +1,144 @@
+"""
+Per-run local index over everything the research agents retrieved.
+
+process_search_results adds every fetched page and its summary to the index of the
+active run, and the search_notes tool lets any sub-agent of that run query it
+without another web search. The supervisor creates one index per run and makes
+it active for its sub-agents with `use_notes_index`.
+"""
+
+from deep_research.utils import tokenize
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing_extensions import Optional
+import math
+import threading
+
+# Raw page content is indexed in passages of about this many characters
+passage_chars = 1200
+
+
+def split_passages(text: str, size: int = passage_chars) -> list[str]:
+    """Split text into passages of about `size` characters on paragraph or sentence boundaries"""
+    passages = []
+    current = ""
+    for paragraph in text.split("\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        while len(paragraph) > size:
+            cut = paragraph.rfind(". ", 0, size)
+            cut = cut + 1 if cut > size // 2 else size
+            passages.append((current + " " + paragraph[:cut]).strip())
+            current, paragraph = "", paragraph[cut:].strip()
+        if len(current) + len(paragraph) > size:
+            passages.append(current.strip())
+            current = ""
+        current += " " + paragraph
+    if current.strip():
+        passages.append(current.strip())
+    return passages
+
+
+class NotesIndex:
+    """In-memory BM25 inverted index over retrieved pages and their summaries, safe to share between threads"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents: list[dict] = []
+        self._postings: dict[str, dict[int, int]] = defaultdict(dict)
+        self._lengths: list[int] = []
+        self._total_length = 0
+        self._sources: set[tuple[str, str]] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, url: str, title: str, text: str, kind: str) -> int:
+        """Index `text` retrieved from url, returns the number of passages added.
+
+        Every (url, kind) pair is only indexed once, so pages fetched by several
+        sub-agents are not duplicated.
+        """
+        if not text:
+            return 0
+        with self._lock:
+            if (url, kind) in self._sources:
+                return 0
+            self._sources.add((url, kind))
+            passages = [text] if kind == "summary" else split_passages(text)
+            for passage in passages:
+                counts = Counter(tokenize(title + " " + passage))
+                doc_id = len(self.documents)
+                self.documents.append({"url": url, "title": title, "text": passage, "kind": kind})
+                for term, frequency in counts.items():
+                    self._postings[term][doc_id] = frequency
+                length = sum(counts.values())
+                self._lengths.append(length)
+                self._total_length += length
+            return len(passages)
+
+    def add_search_results(self, unique_results: dict, summarized_results: dict):
+        """Index the raw pages and the processed content of one search"""
+        for url, result in unique_results.items():
+            self.add(url, result.get("title") or "", result.get("raw_content") or result.get("content") or "", "page")
+        for url, result in summarized_results.items():
+            self.add(url, result.get("title") or "", result.get("content") or "", "summary")
+
+    def search(self, query: str, max_results: int = 5) -> list[tuple[dict, float]]:
+        """Return the best matching (document, score) pairs for the query"""
+        with self._lock:
+            n = len(self.documents)
+            if n == 0:
+                return []
+            average_length = self._total_length / n
+            scores: dict[int, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:max_results]
+            return [(self.documents[doc_id], score) for doc_id, score in best]
+
+
+# Indexes of the supervisor runs in progress, keyed by run id
+run_indexes: dict[str, NotesIndex] = {}
+_run_indexes_lock = threading.Lock()
+
+_active_index: ContextVar[Optional[NotesIndex]] = ContextVar('notes_index', default=None)
+
+
+def index_for_run(run_id: str) -> NotesIndex:
+    """Index of the run `run_id`, created on first use"""
+    with _run_indexes_lock:
+        if run_id not in run_indexes:
+            run_indexes[run_id] = NotesIndex()
+        return run_indexes[run_id]
+
+
+def release_run_index(run_id: str):
+    """Drop the index of a finished run"""
+    with _run_indexes_lock:
+        run_indexes.pop(run_id, None)
+
+
+def get_notes_index() -> Optional[NotesIndex]:
+    """Index of the run in the current context, None outside of a supervised run"""
+    return _active_index.get()
+
+
+@contextmanager
+def use_notes_index(index: NotesIndex):
+    """Make `index` the active notes index for everything run inside the block"""
+    token = _active_index.set(index)
+    try:
+        yield index
+    finally:
+        _active_index.reset(token)
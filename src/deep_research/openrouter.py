@@ -4,19 +4,374 @@ and free models for deep research
 """
 
 from langchain_openai import ChatOpenAI
-from typing_extensions import Optional
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import RunnableLambda
+from deep_research.budget import budget_callback
+from deep_research.parsing import tolerant_structured_output
+from deep_research.cassette import get_cassette
+from pydantic import BaseModel, ValidationError
+from typing_extensions import Optional, List, Dict, Any, Callable
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures, FIRST_COMPLETED
+from collections import deque
+import contextvars
+import openai
+import asyncio
+import threading
+import math
+import time
 import os
 
 
+# Fallback chains per role, the first model is preferred and the following ones are
+# tried in order when it times out, is rate limited, overloaded or returns unparsable output
+MODEL_CHAINS: Dict[str, List[str]] = {
+    'supervisor': ['x-ai/grok-4-fast:free', 'deepseek/deepseek-chat-v3.1:free', 'qwen/qwen3-235b-a22b:free'],
+    'researcher': ['x-ai/grok-4-fast:free', 'deepseek/deepseek-chat-v3.1:free', 'qwen/qwen3-235b-a22b:free'],
+    'compressor': ['x-ai/grok-4-fast:free', 'deepseek/deepseek-chat-v3.1:free', 'qwen/qwen3-235b-a22b:free'],
+    'summarizer': ['qwen/qwen3-4b:free', 'meta-llama/llama-3.3-8b-instruct:free', 'x-ai/grok-4-fast:free'],
+    'scoper': ['x-ai/grok-4-fast:free', 'deepseek/deepseek-chat-v3.1:free', 'qwen/qwen3-235b-a22b:free'],
+}
 
-def init_chat_model(model: str, api_key: Optional[str], temperature: float=0, base_url: str = 'https://openrouter.ai/api/v1'):
+# Seconds before a single model request is abandoned in favour of the next model
+MODEL_TIMEOUT = 60
+
+# Seconds a failed model is skipped before it is tried again as the preferred model
+MODEL_COOLDOWN = 120
+
+# Opt-in request hedging: when a call has not returned after this latency percentile of
+# recent calls, the same request is sent again and the first response wins (None disables)
+HEDGE_PERCENTILE: Optional[float] = float(os.getenv('DEEP_RESEARCH_HEDGE_PERCENTILE')) if os.getenv('DEEP_RESEARCH_HEDGE_PERCENTILE') else None
+
+# Number of recent successful calls the hedge delay is measured from, and how many are
+# needed before hedging kicks in
+HEDGE_WINDOW = 100
+HEDGE_MIN_SAMPLES = 10
+
+# Share of calls which may send a hedged request, so hedging can not double the load
+# on an overloaded provider, and how many unused hedges may be saved up for bursts
+HEDGE_MAX_SHARE = 0.1
+HEDGE_BURST = 3
+
+# Threads used to race hedged requests for synchronous callers
+_hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='hedge')
+
+# Errors which switch the call over to the next model of the chain
+FALLBACK_ERRORS = (
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+    TimeoutError,
+    OutputParserException,
+    ValidationError,
+)
+
+
+def init_chat_model(
+    model: str,
+    api_key: Optional[str],
+    temperature: float=0,
+    base_url: str = 'https://openrouter.ai/api/v1',
+    timeout: Optional[float] = None,
+    max_retries: int = 2,
+    callbacks: Optional[list] = None
+):
     """Chat model initialization similar to langchain init_chat_model, but specific to openrouter"""
     open_router_key = api_key
     if not open_router_key and not os.getenv('OPENROUTER_API_KEY'):
-        raise ValueError('API Key not provided, either provide OPENROUTER_API_KEY as evironment variable or provide in the function')        
+        raise ValueError('API Key not provided, either provide OPENROUTER_API_KEY as evironment variable or provide in the function')
     return ChatOpenAI(
         model = model,
         temperature = temperature,
         api_key = open_router_key if open_router_key else os.getenv('OPENROUTER_API_KEY'),
-        base_url= base_url
+        base_url= base_url,
+        timeout = timeout,
+        max_retries = max_retries,
+        callbacks = callbacks
     )
+
+
+class LatencyTracker:
+    """Rolling window of call latencies used to derive the hedge delay"""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = HEDGE_MIN_SAMPLES) -> Optional[float]:
+        """Nearest-rank percentile of recent latencies, None until enough calls were seen"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(min_samples, 1):
+            return None
+        rank = min(len(samples) - 1, max(0, math.ceil(q * len(samples)) - 1))
+        return samples[rank]
+
+
+class ModelChain:
+    """Ordered list of chat models for one role which falls back to the next model on failure.
+
+    The chain remembers failed models for `cooldown` seconds, so later calls start
+    with the first model that is currently healthy instead of waiting on a model
+    that is known to be overloaded. Exposes the `invoke`, `ainvoke` and
+    `with_structured_output` subset of the chat model interface used by the agents.
+
+    When `hedge_percentile` is set, a call that is still running after that percentile
+    of recent latencies is duplicated to the next healthy model (or the same model if
+    the chain has only one), the first response wins and the other request is cancelled.
+    At most HEDGE_MAX_SHARE of the calls are hedged.
+    """
+
+    def __init__(
+        self,
+        role: str,
+        models: List[str],
+        temperature: float = 0,
+        api_key: Optional[str] = None,
+        timeout: Optional[float] = MODEL_TIMEOUT,
+        cooldown: float = MODEL_COOLDOWN,
+        hedge_percentile: Optional[float] = HEDGE_PERCENTILE,
+    ):
+        if not models:
+            raise ValueError(f'No models configured for role {role}')
+        if hedge_percentile is not None and not 0 < hedge_percentile < 1:
+            raise ValueError(f'hedge_percentile must be between 0 and 1 exclusive, got {hedge_percentile} (e.g. 0.95 for the 95th percentile)')
+        self.role = role
+        self.model_names = list(models)
+        self.models = [
+            init_chat_model(
+                model=name, api_key=api_key, temperature=temperature, timeout=timeout, max_retries=0,
+                callbacks=[budget_callback]
+            )
+            for name in self.model_names
+        ]
+        self.cooldown = cooldown
+        self._unhealthy_until = [0.0] * len(self.models)
+        self._lock = threading.Lock()
+        self.hedge_percentile = hedge_percentile
+        self.latency = LatencyTracker()
+        self._hedge_tokens = float(HEDGE_BURST)
+
+    def with_structured_output(self, schema: Any, **kwargs) -> 'StructuredModelChain':
+        """Return a view of the chain whose calls return instances of `schema`"""
+        return StructuredModelChain(self, schema, **kwargs)
+
+    def invoke(self, input: Any, config: Optional[dict] = None, **kwargs) -> Any:
+        call = lambda: self._invoke(lambda model: model, input, config, **kwargs)
+        cassette = get_cassette()
+        return cassette.call('chat', self.role, input, call) if cassette else call()
+
+    async def ainvoke(self, input: Any, config: Optional[dict] = None, **kwargs) -> Any:
+        call = lambda: self._ainvoke(lambda model: model, input, config, **kwargs)
+        cassette = get_cassette()
+        return await (cassette.acall('chat', self.role, input, call) if cassette else call())
+
+    @property
+    def healthy_model(self) -> str:
+        """Name of the model the next call will be sent to first"""
+        return self.model_names[self._candidates()[0]]
+
+    def _candidates(self) -> List[int]:
+        """Model indices in the order they should be tried, healthy models first"""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [i for i, until in enumerate(self._unhealthy_until) if until <= now]
+            cooling = sorted(
+                (i for i, until in enumerate(self._unhealthy_until) if until > now),
+                key=lambda i: self._unhealthy_until[i]
+            )
+        # cooling models are still tried as a last resort rather than failing outright
+        return healthy + cooling
+
+    def _mark_failed(self, index: int, error: Exception):
+        with self._lock:
+            self._unhealthy_until[index] = time.monotonic() + self.cooldown
+        print(f"Model {self.model_names[index]} failed for {self.role} ({type(error).__name__}), falling back")
+
+    def _mark_healthy(self, index: int):
+        with self._lock:
+            self._unhealthy_until[index] = 0.0
+
+    def _hedge_delay(self) -> Optional[float]:
+        if self.hedge_percentile is None:
+            return None
+        with self._lock:
+            # every call earns a share of a hedge, see HEDGE_MAX_SHARE
+            self._hedge_tokens = min(float(HEDGE_BURST), self._hedge_tokens + HEDGE_MAX_SHARE)
+        return self.latency.percentile(self.hedge_percentile)
+
+    def _take_hedge(self) -> bool:
+        """Whether a slow call may send its hedged request, spends one saved up hedge"""
+        with self._lock:
+            if self._hedge_tokens < 1:
+                return False
+            self._hedge_tokens -= 1
+            return True
+
+    def _call(self, bind: Callable, index: int, input: Any, config: Optional[dict], **kwargs) -> Any:
+        started = time.monotonic()
+        try:
+            result = _check_result(bind(self.models[index]).invoke(input, config, **kwargs))
+        except FALLBACK_ERRORS as e:
+            self._mark_failed(index, e)
+            raise
+        self.latency.record(time.monotonic() - started)
+        self._mark_healthy(index)
+        return result
+
+    async def _acall(self, bind: Callable, index: int, input: Any, config: Optional[dict], **kwargs) -> Any:
+        started = time.monotonic()
+        try:
+            result = _check_result(await bind(self.models[index]).ainvoke(input, config, **kwargs))
+        except FALLBACK_ERRORS as e:
+            self._mark_failed(index, e)
+            raise
+        self.latency.record(time.monotonic() - started)
+        self._mark_healthy(index)
+        return result
+
+    def _invoke(self, bind: Callable, input: Any, config: Optional[dict], **kwargs) -> Any:
+        candidates = self._candidates()
+        hedge_delay = self._hedge_delay()
+        last_error = None
+
+        if hedge_delay is None:
+            for index in candidates:
+                try:
+                    return self._call(bind, index, input, config, **kwargs)
+                except FALLBACK_ERRORS as e:
+                    last_error = e
+            raise last_error
+
+        # Threads can not be interrupted, so a losing request is only cancelled if it has
+        # not started yet, otherwise it finishes in the background and its result is dropped
+        def launch(index):
+            context = contextvars.copy_context()
+            started = threading.Event()
+            def run():
+                started.set()
+                return self._call(bind, index, input, config, **kwargs)
+            return _hedge_executor.submit(context.run, run), started
+
+        queue = list(candidates)
+        first, started = launch(queue.pop(0))
+        futures = {first}
+        hedged = False
+        try:
+            # time spent queued for a free thread is not request latency, the hedge delay
+            # is measured from when the request starts like the latencies it is derived from
+            started.wait()
+            while futures:
+                done, futures = wait_futures(futures, timeout=None if hedged else hedge_delay, return_when=FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    if self._take_hedge():
+                        futures.add(launch(queue.pop(0) if queue else candidates[0])[0])
+                    continue
+                for future in done:
+                    try:
+                        return future.result()
+                    except FALLBACK_ERRORS as e:
+                        last_error = e
+                if not futures and queue:
+                    futures.add(launch(queue.pop(0))[0])
+            raise last_error
+        finally:
+            for future in futures:
+                future.cancel()
+
+    async def _ainvoke(self, bind: Callable, input: Any, config: Optional[dict], **kwargs) -> Any:
+        candidates = self._candidates()
+        hedge_delay = self._hedge_delay()
+        last_error = None
+
+        if hedge_delay is None:
+            for index in candidates:
+                try:
+                    return await self._acall(bind, index, input, config, **kwargs)
+                except FALLBACK_ERRORS as e:
+                    last_error = e
+            raise last_error
+
+        def launch(index):
+            return asyncio.ensure_future(self._acall(bind, index, input, config, **kwargs))
+
+        queue = list(candidates)
+        tasks = {launch(queue.pop(0))}
+        hedged = False
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, timeout=None if hedged else hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    if self._take_hedge():
+                        tasks.add(launch(queue.pop(0) if queue else candidates[0]))
+                    continue
+                for task in done:
+                    try:
+                        return task.result()
+                    except FALLBACK_ERRORS as e:
+                        last_error = e
+                if not tasks and queue:
+                    tasks.add(launch(queue.pop(0)))
+            raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class StructuredModelChain:
+    """Structured output view of a ModelChain, binds the schema lazily on each model.
+
+    Replies that fail structured parsing are repaired locally (see deep_research.parsing)
+    before the chain falls back to re-asking the next model.
+    """
+
+    def __init__(self, chain: ModelChain, schema: Any, **kwargs):
+        self.chain = chain
+        self.schema = schema
+        self.kwargs = kwargs
+        self._bound = {}
+
+    def _bind(self, model: ChatOpenAI):
+        if id(model) not in self._bound:
+            if isinstance(self.schema, type) and issubclass(self.schema, BaseModel) and 'include_raw' not in self.kwargs:
+                self._bound[id(model)] = (
+                    model.with_structured_output(self.schema, include_raw=True, **self.kwargs)
+                    | RunnableLambda(tolerant_structured_output(self.schema))
+                )
+            else:
+                self._bound[id(model)] = model.with_structured_output(self.schema, **self.kwargs)
+        return self._bound[id(model)]
+
+    @property
+    def _cassette_scope(self) -> str:
+        return f"{self.chain.role}:{getattr(self.schema, '__name__', 'schema')}"
+
+    def invoke(self, input: Any, config: Optional[dict] = None, **kwargs) -> Any:
+        call = lambda: self.chain._invoke(self._bind, input, config, **kwargs)
+        cassette = get_cassette()
+        return cassette.call('chat', self._cassette_scope, input, call, self.schema) if cassette else call()
+
+    async def ainvoke(self, input: Any, config: Optional[dict] = None, **kwargs) -> Any:
+        call = lambda: self.chain._ainvoke(self._bind, input, config, **kwargs)
+        cassette = get_cassette()
+        return await (cassette.acall('chat', self._cassette_scope, input, call, self.schema) if cassette else call())
+
+
+def _check_result(result: Any) -> Any:
+    """Structured output returns None when the model reply could not be parsed"""
+    if result is None:
+        raise OutputParserException('Model returned no parsable output')
+    return result
+
+
+def init_model_chain(role: str, temperature: float = 0, api_key: Optional[str] = None, **kwargs) -> ModelChain:
+    """Init the fallback chain configured for `role` in MODEL_CHAINS"""
+    if role not in MODEL_CHAINS:
+        raise ValueError(f'Unknown model role {role}, expected one of {list(MODEL_CHAINS)}')
+    return ModelChain(role, MODEL_CHAINS[role], temperature=temperature, api_key=api_key, **kwargs)
@@ -0,0 +1,314 @@
+"""
+Tolerant parsing of structured model output.
+
+Small free models often wrap their JSON in code fences or <think> blocks, stop in
+the middle of an object, or return values with the wrong type. The helpers here
+repair such output locally so a malformed reply does not cost another model call.
+"""
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import AIMessage
+from pydantic import BaseModel, ValidationError
+from typing_extensions import Any, Optional, Type, get_origin, get_args, Union
+import ast
+import json
+import re
+import uuid
+
+_THINK_BLOCK = re.compile(r"<think>.*?(</think>|$)", re.DOTALL | re.IGNORECASE)
+_CODE_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(```|$)", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+TRUE_STRINGS = {"true", "yes", "y", "1"}
+FALSE_STRINGS = {"false", "no", "n", "0", "", "none", "null"}
+
+
+def strip_wrappers(text: str) -> str:
+    """Remove reasoning blocks and code fences around a JSON payload"""
+    text = _THINK_BLOCK.sub("", text).strip()
+    fenced = _CODE_FENCE.search(text)
+    if fenced:
+        text = fenced.group(1).strip()
+    return text
+
+
+def _scan(text: str) -> tuple[list[str], bool, list[int]]:
+    """Walk a JSON document outside of strings.
+
+    Returns the closers of the containers still open at the end, whether the
+    document ends inside a string, and the positions of commas where a partial
+    document can be cut.
+    """
+    stack = []
+    commas = []
+    in_string = False
+    escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+        elif char == ",":
+            commas.append(index)
+    return stack, in_string, commas
+
+
+def close_json(text: str) -> str:
+    """Close unterminated strings, objects and arrays of a truncated JSON document"""
+    stack, in_string, _ = _scan(text)
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(",")
+    if text.endswith(":"):
+        text += " null"
+    return text + "".join(reversed(stack))
+
+
+def loads_tolerant(text: str) -> Any:
+    """Parse JSON from model output, repairing common defects.
+
+    Handles code fences, <think> blocks, leading prose, trailing commas,
+    Python literals and documents cut off in the middle (partial or
+    streamed output). Raises ValueError when nothing usable can be recovered.
+    """
+    text = strip_wrappers(text)
+    starts = [index for index in (text.find("{"), text.find("[")) if index != -1]
+    if not starts:
+        raise ValueError("No JSON object found in model output")
+    text = _TRAILING_COMMA.sub(r"\1", text[min(starts):])
+
+    try:
+        return json.JSONDecoder().raw_decode(text)[0]
+    except json.JSONDecodeError:
+        pass
+
+    try:
+        value = ast.literal_eval(text)
+        if isinstance(value, (dict, list)):
+            return value
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        pass
+
+    _, in_string, commas = _scan(text)
+    # a document cut inside a string would keep a half written value, so prefer
+    # dropping the incomplete trailing member in that case
+    attempts = [text[:point] for point in reversed(commas)]
+    attempts = attempts + [text] if in_string else [text] + attempts
+    for attempt in attempts:
+        try:
+            return json.loads(close_json(attempt))
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("Model output is not recoverable JSON")
+
+
+def _annotation_kind(annotation: Any) -> Any:
+    """Strip Optional/Annotated to the underlying type"""
+    origin = get_origin(annotation)
+    if origin is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return _annotation_kind(args[0]) if len(args) == 1 else annotation
+    return annotation
+
+
+def _coerce_tool_call(value: Any) -> Any:
+    """Normalize OpenAI style or partial tool calls to langchain ToolCall dicts"""
+    if not isinstance(value, dict):
+        return value
+    call = dict(value)
+    function = call.pop("function", None)
+    if isinstance(function, dict):
+        call.setdefault("name", function.get("name"))
+        call.setdefault("args", function.get("arguments", {}))
+    if "args" not in call:
+        call["args"] = call.pop("arguments", call.pop("parameters", {}))
+    if isinstance(call["args"], str):
+        try:
+            call["args"] = loads_tolerant(call["args"]) if call["args"].strip() else {}
+        except ValueError:
+            call["args"] = {}
+    if call["args"] is None:
+        call["args"] = {}
+    if not call.get("id"):
+        call["id"] = str(uuid.uuid4())
+    call.pop("type", None)
+    return call
+
+
+def _coerce_value(value: Any, annotation: Any) -> Any:
+    kind = _annotation_kind(annotation)
+    origin = get_origin(kind)
+
+    if kind is bool:
+        if isinstance(value, str):
+            lowered = value.strip().lower()
+            if lowered in TRUE_STRINGS:
+                return True
+            if lowered in FALSE_STRINGS:
+                return False
+        if isinstance(value, (int, float)):
+            return bool(value)
+        return value
+
+    if kind is str:
+        if value is None:
+            return ""
+        if isinstance(value, list):
+            return "\n".join(item if isinstance(item, str) else json.dumps(item) for item in value)
+        if isinstance(value, dict):
+            return json.dumps(value)
+        if isinstance(value, (int, float, bool)):
+            return str(value)
+        return value
+
+    if origin in (list, tuple) or kind in (list, tuple):
+        if isinstance(value, str):
+            try:
+                value = loads_tolerant(value)
+            except ValueError:
+                return [value]
+        if value is None:
+            return []
+        if not isinstance(value, list):
+            value = [value]
+        item_annotation = (get_args(kind) or [Any])[0]
+        if getattr(item_annotation, "__name__", "") == "ToolCall":
+            return [_coerce_tool_call(item) for item in value]
+        return [_coerce_value(item, item_annotation) for item in value]
+
+    if isinstance(kind, type) and issubclass(kind, BaseModel) and isinstance(value, dict):
+        return coerce_to_schema(value, kind)
+
+    return value
+
+
+def _unwrap(data: Any, schema: Type[BaseModel]) -> Any:
+    """Unwrap payloads nested under the schema name, 'properties' or 'arguments'"""
+    fields = set(schema.model_fields)
+    while isinstance(data, dict) and not fields & set(data) and len(data) == 1:
+        (key, inner), = data.items()
+        if isinstance(inner, str):
+            try:
+                inner = loads_tolerant(inner)
+            except ValueError:
+                break
+        if not isinstance(inner, dict):
+            break
+        data = inner
+    if isinstance(data, list) and len(data) == 1 and isinstance(data[0], dict):
+        return _unwrap(data[0], schema)
+    return data
+
+
+def _is_tool_call(data: Any) -> bool:
+    """Whether `data` looks like a single tool call rather than an object of the requested schema"""
+    return isinstance(data, dict) and (
+        isinstance(data.get("function"), dict)
+        or ("name" in data and bool({"arguments", "args", "parameters"} & set(data)))
+    )
+
+
+def coerce_to_schema(data: Any, schema: Type[BaseModel]) -> dict:
+    """Coerce loosely typed model output towards the field types of `schema`.
+
+    Models sometimes answer with a bare tool call instead of the schema. A call
+    named after the schema is unwrapped to its arguments, any other call becomes
+    the `tool_calls` of schemas which have that field. Raises ValueError when
+    none of the schema's fields are present or a required field is missing, so
+    the caller falls back instead of receiving an empty object.
+    """
+    data = _unwrap(data, schema)
+    fields = schema.model_fields
+    calls = data if isinstance(data, list) and data and all(_is_tool_call(item) for item in data) else None
+    if _is_tool_call(data) and not set(fields) & set(data):
+        call = _coerce_tool_call(data)
+        if str(call.get("name", "")).lower() == schema.__name__.lower():
+            data = call["args"]
+        else:
+            calls = [data]
+    if calls is not None and "tool_calls" in fields:
+        # a reply that is only tool calls carries no text for the other fields
+        coerced = {"tool_calls": _coerce_value(calls, fields["tool_calls"].annotation)}
+        for name, field in fields.items():
+            if name != "tool_calls" and field.is_required() and _annotation_kind(field.annotation) is str:
+                coerced[name] = ""
+        return coerced
+
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected an object for {schema.__name__}, got {type(data).__name__}")
+    if not set(fields) & set(data):
+        raise ValueError(f"None of the {schema.__name__} fields found in model output (keys: {sorted(data)[:10]})")
+    missing = [name for name, field in fields.items() if field.is_required() and name not in data]
+    if missing:
+        raise ValueError(f"Model output is missing required {schema.__name__} fields {missing}")
+    coerced = dict(data)
+    for name, field in fields.items():
+        if name in coerced:
+            coerced[name] = _coerce_value(coerced[name], field.annotation)
+    return coerced
+
+
+def parse_structured(payload: Any, schema: Type[BaseModel]) -> BaseModel:
+    """Parse a JSON string or decoded object into `schema`, repairing it where possible.
+
+    Raises OutputParserException when the payload can not be repaired.
+    """
+    try:
+        data = loads_tolerant(payload) if isinstance(payload, str) else payload
+        return schema.model_validate(coerce_to_schema(data, schema))
+    except (ValueError, ValidationError) as e:
+        raise OutputParserException(f"Could not repair {schema.__name__} output: {e}") from e
+
+
+def _message_text(message: AIMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(
+        block.get("text", "") if isinstance(block, dict) else str(block)
+        for block in message.content
+    )
+
+
+def repair_structured_output(raw: Optional[AIMessage], schema: Type[BaseModel]) -> BaseModel:
+    """Recover `schema` from a raw model reply whose structured parsing failed.
+
+    Tries the tool call arguments first, then arguments the provider could not
+    decode, then the message text itself. A call to some other tool than the
+    schema is kept whole, so coerce_to_schema can map it to `tool_calls`.
+    """
+    candidates = []
+    if raw is not None:
+        candidates += [
+            call["args"] if call.get("name") == schema.__name__ else {"name": call.get("name"), "args": call["args"]}
+            for call in getattr(raw, "tool_calls", []) or []
+        ]
+        candidates += [call.get("args") or "" for call in getattr(raw, "invalid_tool_calls", []) or []]
+        candidates.append(_message_text(raw))
+
+    last_error = OutputParserException(f"Model returned no {schema.__name__} output")
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return parse_structured(candidate, schema)
+        except OutputParserException as e:
+            last_error = e
+    raise last_error
+
+
+def tolerant_structured_output(schema: Type[BaseModel]):
+    """Build the post-processing step for `with_structured_output(schema, include_raw=True)`"""
+    def parse(output: dict) -> BaseModel:
+        if output.get("parsed") is not None and output.get("parsing_error") is None:
+            return output["parsed"]
+        return repair_structured_output(output.get("raw"), schema)
+    return parse
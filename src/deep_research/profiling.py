@@ -0,0 +1,397 @@
+"""
+Opt-in CPU and memory profiling of the graph nodes.
+
+Set DEEP_RESEARCH_PROFILE_DIR before the graphs are imported to wrap every node
+of the compiled graphs. Each top level run of a graph then gets its own
+directory under it with:
+
+    summary.json     calls, wall time, sampled CPU time and net traced memory growth per node
+    hotspots.txt     per node, the lines the CPU samples landed on and the functions they passed through
+    allocations.txt  the lines whose memory grew over the whole run and over sampled calls of each node
+
+CPU time is measured by sampling the stacks of all threads every
+DEEP_RESEARCH_PROFILE_INTERVAL seconds. A sample is charged to the innermost
+node on the stack, so an awaiting coroutine costs nothing and a sub-agent node
+running inside supervisor_tools is charged to itself. Samples with no node on the
+stack, like the state reducers LangGraph runs between nodes and tools run in
+executor threads, are reported under `outside_nodes`, and the cost of the
+snapshots under `profiler`. Threads that barely used their CPU clock since the
+previous sample, e.g. blocked in a sleep, or whose innermost frame is one of
+idle_frames, like a socket read or a selector, are counted as waiting, not as
+CPU time.
+
+Memory growth per node call is the change of tracemalloc's traced memory, which
+is cheap to read. Full snapshots are expensive with large heaps, so they are only
+diffed between the start and end of the run and around every
+DEEP_RESEARCH_PROFILE_SNAPSHOT_EVERY-th call of each node in the process. Nodes running
+concurrently see each other's allocations, so read the per node numbers as an
+upper bound, and the stacks of concurrent runs, like several service jobs, end
+up in each other's profiles. Tracing allocations still slows runs down, keep
+profiling off outside of investigations.
+"""
+
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing_extensions import Optional
+from os import getenv
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+# Directory the per-run reports are written to, unset to disable profiling
+profile_dir = getenv('DEEP_RESEARCH_PROFILE_DIR')
+
+# Seconds between stack samples
+profile_interval = float(getenv('DEEP_RESEARCH_PROFILE_INTERVAL', 0.005))
+
+# Frames kept per tracemalloc traceback, allocations are reported by their innermost line
+traceback_frames = 1
+
+# Every how many calls of a node, counted over all runs of the process, its allocations
+# are diffed by line, 0 to only diff whole runs
+snapshot_every = int(getenv('DEEP_RESEARCH_PROFILE_SNAPSHOT_EVERY', 50))
+
+# Entries listed per node in the hotspot and allocation reports
+report_top = 25
+
+# Name samples and allocations without a node on the stack are reported under
+outside_nodes = 'outside_nodes'
+
+# Name the snapshots and diffs taken by the node wrappers are reported under
+profiler_overhead = 'profiler'
+
+# Name the allocations between the start and end of the run are reported under
+whole_run = 'run'
+
+# Share of the time between two samples a thread must have spent on the CPU to count as running
+min_cpu_share = 0.2
+
+# Innermost frames of a thread that is blocked rather than running, by (file name, function),
+# used where the CPU clocks of other threads can not be read
+idle_frames = {
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('thread.py', '_worker'),
+    ('socket.py', 'readinto'),
+    ('socket.py', 'accept'),
+    ('ssl.py', 'read'),
+    ('ssl.py', 'recv_into'),
+}
+
+# code objects of the wrapped nodes, to recognise them on sampled stacks
+_node_codes: dict = {}
+
+# calls of each node started so far, to pick the calls that are snapshotted
+_node_calls: Counter = Counter()
+_node_calls_lock = threading.Lock()
+
+# runs currently profiling, tracemalloc is stopped when the last one closes unless it was tracing before
+_tracing_runs = 0
+_tracing_started = False
+_tracing_lock = threading.Lock()
+
+_active_profile: ContextVar[Optional["RunProfile"]] = ContextVar('active_profile', default=None)
+
+
+def profiling_enabled() -> bool:
+    return bool(profile_dir)
+
+
+def _location(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_filename}:{frame.f_lineno} {code.co_name}"
+
+
+def _function(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_filename}:{code.co_firstlineno} {code.co_name}"
+
+
+class RunProfile:
+    """CPU samples and memory growth of one graph run, written to `directory` on close"""
+
+    def __init__(self, name: str, directory: Optional[str] = None, interval: Optional[float] = None):
+        self.name = name
+        self.directory = directory or os.path.join(
+            profile_dir or '.', f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:6]}"
+        )
+        self.interval = interval or profile_interval
+        self.started = time.monotonic()
+        self.samples = 0
+        self.waiting_samples = 0
+        self.self_samples: dict[str, Counter] = defaultdict(Counter)
+        self.total_samples: dict[str, Counter] = defaultdict(Counter)
+        self.node_samples: Counter = Counter()
+        self.calls: Counter = Counter()
+        self.snapshot_calls: Counter = Counter()
+        self.wall_time: Counter = Counter()
+        self.allocations: dict[str, Counter] = defaultdict(Counter)
+        self.allocated: Counter = Counter()
+        self._first_snapshot = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{name}", daemon=True)
+
+    def start(self):
+        global _tracing_runs, _tracing_started
+        with _tracing_lock:
+            if _tracing_runs == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(traceback_frames)
+                _tracing_started = True
+            _tracing_runs += 1
+        self._first_snapshot = tracemalloc.take_snapshot()
+        self._sampler.start()
+
+    def _sample_loop(self):
+        own_thread = threading.get_ident()
+        cpu_times = {}
+        sampled_at = time.monotonic()
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            elapsed, sampled_at = now - sampled_at, now
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_thread:
+                    # threads whose clock can not be read are judged by their frame alone
+                    self._record_sample(frame, self._thread_running(thread_id, cpu_times, elapsed) is not False)
+
+    def _thread_running(self, thread_id: int, cpu_times: dict, elapsed: float) -> Optional[bool]:
+        """Whether the thread used the CPU since the last sample, None where its CPU clock is not readable"""
+        try:
+            cpu_time = time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+        except (AttributeError, OSError):
+            return None
+        previous = cpu_times.get(thread_id)
+        cpu_times[thread_id] = cpu_time
+        return previous is not None and cpu_time - previous >= min_cpu_share * elapsed
+
+    def _record_sample(self, frame, running: bool = True):
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in idle_frames:
+            running = False
+        if not running:
+            with self._lock:
+                self.waiting_samples += 1
+            return
+
+        node = None
+        stack = []
+        while frame is not None:
+            node = _node_codes.get(frame.f_code)
+            if node is not None:
+                break
+            stack.append(frame)
+            frame = frame.f_back
+        node = node or outside_nodes
+
+        with self._lock:
+            self.samples += 1
+            self.node_samples[node] += 1
+            self.self_samples[node][_location(stack[0]) if stack else node] += 1
+            for function in {_function(f) for f in stack}:
+                self.total_samples[node][function] += 1
+
+    def record_call(self, node: str, wall_time: float, memory_growth: int, before=None, after=None):
+        """Add one finished node call, with the tracemalloc snapshots taken around it if it was sampled"""
+        with self._lock:
+            self.calls[node] += 1
+            self.wall_time[node] += wall_time
+            self.allocated[node] += memory_growth
+        if before is not None and after is not None:
+            self.add_allocations(node, before, after)
+
+    def add_allocations(self, name: str, before, after):
+        diff = after.compare_to(before, 'lineno')
+        with self._lock:
+            if name != whole_run:
+                self.snapshot_calls[name] += 1
+            for stat in diff:
+                if stat.size_diff and stat.traceback[0].filename not in (tracemalloc.__file__, __file__):
+                    self.allocations[name][str(stat.traceback[0])] += stat.size_diff
+
+    def close(self):
+        """Stop sampling and write the reports"""
+        self._stop.set()
+        self._sampler.join()
+        self.add_allocations(whole_run, self._first_snapshot, tracemalloc.take_snapshot())
+        global _tracing_runs, _tracing_started
+        with _tracing_lock:
+            _, peak = tracemalloc.get_traced_memory()
+            _tracing_runs -= 1
+            if _tracing_runs == 0 and _tracing_started:
+                tracemalloc.stop()
+                _tracing_started = False
+        try:
+            self.write_reports(peak)
+        except OSError as e:
+            print(f"Could not write profile of {self.name} to {self.directory}: {e}")
+
+    def summary(self, peak_memory: int = 0) -> dict:
+        nodes = sorted(set(self.node_samples) | set(self.calls), key=lambda node: -self.node_samples[node])
+        return {
+            "run": self.name,
+            "wall_seconds": round(time.monotonic() - self.started, 3),
+            "sample_interval": self.interval,
+            "cpu_samples": self.samples,
+            "waiting_samples": self.waiting_samples,
+            "peak_traced_bytes": peak_memory,
+            "nodes": {
+                node: {
+                    "calls": self.calls[node],
+                    "wall_seconds": round(self.wall_time[node], 3),
+                    "cpu_samples": self.node_samples[node],
+                    "cpu_seconds": round(self.node_samples[node] * self.interval, 3),
+                    "net_allocated_bytes": self.allocated[node],
+                    "snapshot_calls": self.snapshot_calls[node],
+                }
+                for node in nodes
+            }
+        }
+
+    def write_reports(self, peak_memory: int = 0):
+        summary = self.summary(peak_memory)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'summary.json'), 'w') as file:
+            json.dump(summary, file, indent=2)
+
+        with open(os.path.join(self.directory, 'hotspots.txt'), 'w') as file:
+            for node, stats in summary["nodes"].items():
+                if not stats["cpu_samples"]:
+                    continue
+                file.write(f"== {node}: {stats['cpu_samples']} samples, ~{stats['cpu_seconds']}s CPU over {stats['calls']} calls\n")
+                file.write("-- self (line the sample was taken on)\n")
+                for location, count in self.self_samples[node].most_common(report_top):
+                    file.write(f"{count:8d} {100 * count / stats['cpu_samples']:5.1f}%  {location}\n")
+                file.write("-- total (function on the stack below the node)\n")
+                for function, count in self.total_samples[node].most_common(report_top):
+                    file.write(f"{count:8d} {100 * count / stats['cpu_samples']:5.1f}%  {function}\n")
+                file.write("\n")
+
+        with open(os.path.join(self.directory, 'allocations.txt'), 'w') as file:
+            headings = {whole_run: "whole run, between its first and last snapshot"}
+            for node, stats in summary["nodes"].items():
+                headings[node] = (
+                    f"{node}: {stats['net_allocated_bytes'] / 1024:.1f} KiB net over {stats['calls']} calls, "
+                    f"by line over {stats['snapshot_calls']} sampled calls"
+                )
+            for name, heading in headings.items():
+                if not self.allocations[name]:
+                    continue
+                file.write(f"== {heading}\n")
+                grown = sorted(self.allocations[name].items(), key=lambda item: -abs(item[1]))
+                for location, size in grown[:report_top]:
+                    file.write(f"{size / 1024:12.1f} KiB  {location}\n")
+                file.write("\n")
+
+
+# the snapshots at the run boundaries are profiler overhead like those around node calls
+for _method in (RunProfile.start, RunProfile.close):
+    _node_codes[_method.__code__] = profiler_overhead
+
+
+@contextmanager
+def profile_run(name: str, directory: Optional[str] = None):
+    """Profile the graph runs inside the block into one report directory.
+
+    Nested runs, like the research agents started by the supervisor, add to the
+    profile of the outermost run.
+
+    Args:
+        name: Name of the run, part of the directory name
+        directory: Report directory, by default a new directory under profile_dir
+    """
+    if _active_profile.get() is not None:
+        yield _active_profile.get()
+        return
+    profile = RunProfile(name, directory)
+    token = _active_profile.set(profile)
+    profile.start()
+    try:
+        yield profile
+    finally:
+        _active_profile.reset(token)
+        profile.close()
+        print(f"Profile of {name} written to {profile.directory}")
+
+
+def profile_node(fn):
+    """Wrap a graph node to record its calls in the active run profile, returns fn unchanged when profiling is off"""
+    if not profiling_enabled():
+        return fn
+    name = f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+    _node_codes[fn.__code__] = name
+
+    def started():
+        profile = _active_profile.get()
+        if profile is None:
+            return None, None, 0, 0.0
+        with _node_calls_lock:
+            _node_calls[name] += 1
+            sampled = bool(snapshot_every) and _node_calls[name] % snapshot_every == 0
+        before = tracemalloc.take_snapshot() if sampled else None
+        return profile, before, tracemalloc.get_traced_memory()[0], time.monotonic()
+
+    def finished(profile, before, memory, start):
+        if profile is not None:
+            after = tracemalloc.take_snapshot() if before is not None else None
+            profile.record_call(name, time.monotonic() - start, tracemalloc.get_traced_memory()[0] - memory, before, after)
+
+    _node_codes[started.__code__] = _node_codes[finished.__code__] = profiler_overhead
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def profiled(*args, **kwargs):
+            profile, before, memory, start = started()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                finished(profile, before, memory, start)
+    else:
+        @functools.wraps(fn)
+        def profiled(*args, **kwargs):
+            profile, before, memory, start = started()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                finished(profile, before, memory, start)
+    return profiled
+
+
+def profile_graph(graph, name: str):
+    """Run every invoke and stream of a compiled graph inside profile_run, returns the graph unchanged when profiling is off"""
+    if not profiling_enabled():
+        return graph
+    invoke, ainvoke, stream, astream = graph.invoke, graph.ainvoke, graph.stream, graph.astream
+
+    @functools.wraps(invoke)
+    def profiled_invoke(*args, **kwargs):
+        with profile_run(name):
+            return invoke(*args, **kwargs)
+
+    @functools.wraps(ainvoke)
+    async def profiled_ainvoke(*args, **kwargs):
+        with profile_run(name):
+            return await ainvoke(*args, **kwargs)
+
+    @functools.wraps(stream)
+    def profiled_stream(*args, **kwargs):
+        with profile_run(name):
+            yield from stream(*args, **kwargs)
+
+    @functools.wraps(astream)
+    async def profiled_astream(*args, **kwargs):
+        with profile_run(name):
+            async for chunk in astream(*args, **kwargs):
+                yield chunk
+
+    graph.invoke, graph.ainvoke = profiled_invoke, profiled_ainvoke
+    graph.stream, graph.astream = profiled_stream, profiled_astream
+    return graph
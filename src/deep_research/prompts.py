@@ -186,6 +186,41 @@ Remember, your goal is to create a summary that can be easily understood and uti
 Today's date is {date}.
 """
 
+summarize_webpages_batch_prompt="""
+You are tasked with summarizing the raw content of several webpages retrieved from a web search. Summarize every webpage separately, preserving the most important information of each. These summaries will be used by a downstream research agent, so it's crucial to maintain the key details without losing essential information.
+
+Here are the webpages, each with its URL:
+
+{webpages}
+
+For every webpage follow these guidelines:
+
+1. Identify and preserve the main topic or purpose of the webpage.
+2. Retain key facts, statistics, and data points that are central to the content's message.
+3. Keep important quotes from credible sources or experts.
+4. Include relevant dates, names, and locations that are crucial to understanding the content.
+5. Summarize lengthy explanations while keeping the core message intact.
+6. Do not mix information between webpages.
+
+Each summary should be significantly shorter than the original content but comprehensive enough to stand alone as a source of information. Aim for about 25-30 percent of the original length, unless the content is already concise.
+
+Present your summaries in the following format, with one entry per webpage and the URL copied exactly:
+
+```
+{{
+   "summaries": [
+      {{
+         "url": "URL of the webpage",
+         "summary": "Your summary here, structured with appropriate paragraphs or bullet points as needed",
+         "key_excerpts": "First important quote or excerpt, Second important quote or excerpt, ...up to a maximum of 5"
+      }}
+   ]
+}}
+```
+
+Today's date is {date}.
+"""
+
 compress_research_system_prompt = """You are a research assistant that has conducted research on a topic by calling several tools and web searches. Your job is now to clean up the findings, but preserve all of the relevant statements and information that the researcher has gathered. For context, today's date is {date}.
 
 <Task>
@@ -0,0 +1,69 @@
+"""
+Local relevance ranking of search results, used to decide which pages are worth summarizing
+"""
+
+from deep_research.utils import tokenize
+from collections import Counter
+import numpy as np
+
+# Share of Tavily's own score in the combined relevance, the rest is the local BM25 score
+tavily_score_weight = 0.5
+
+
+def bm25_scores(query_tokens: list[str], documents: list[list[str]], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """Okapi BM25 score of every tokenized document for the query tokens.
+
+    Uses the non-negative IDF variant so terms present in most documents of a
+    small result set still count a little instead of going negative.
+    """
+    if not documents:
+        return np.zeros(0)
+    lengths = np.array([len(tokens) for tokens in documents], dtype=np.float64)
+    average_length = lengths.mean() or 1.0
+    frequencies = [Counter(tokens) for tokens in documents]
+
+    scores = np.zeros(len(documents))
+    for term in set(query_tokens):
+        term_frequency = np.array([counts.get(term, 0) for counts in frequencies], dtype=np.float64)
+        document_frequency = np.count_nonzero(term_frequency)
+        if document_frequency == 0:
+            continue
+        idf = np.log(1 + (len(documents) - document_frequency + 0.5) / (document_frequency + 0.5))
+        scores += idf * term_frequency * (k1 + 1) / (term_frequency + k1 * (1 - b + b * lengths / average_length))
+    return scores
+
+
+def rank_search_results(unique_results: dict, query: str) -> list[tuple[str, float]]:
+    """Rank search results by Tavily's score combined with a local BM25 score.
+
+    BM25 is computed over the snippet and raw content of each result and scaled
+    to [0, 1] by the best result, so both parts are on Tavily's score range.
+
+    Args:
+        unique_results: Dictionary mapping URLs to search results
+        query: Search query the results were retrieved for
+
+    Returns:
+        (url, relevance) pairs, most relevant first
+    """
+    urls = list(unique_results)
+    if not urls:
+        return []
+
+    documents = [
+        tokenize(f"{unique_results[url].get('title') or ''} {unique_results[url].get('content') or ''} "
+                 f"{unique_results[url].get('raw_content') or ''}")
+        for url in urls
+    ]
+    local = bm25_scores(tokenize(query or ""), documents)
+    if local.max() > 0:
+        local = local / local.max()
+
+    tavily = np.array([float(unique_results[url].get('score') or 0) for url in urls])
+    if not query:
+        combined = tavily
+    else:
+        combined = tavily_score_weight * tavily + (1 - tavily_score_weight) * local
+
+    order = np.argsort(-combined, kind="stable")
+    return [(urls[i], float(combined[i])) for i in order]
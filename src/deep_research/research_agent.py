@@ -1,20 +1,30 @@
 
-from deep_research.openrouter import init_chat_model
+from deep_research.openrouter import init_model_chain
 from langchain_core.messages import SystemMessage
 from deep_research.prompts import research_agent_prompt, compress_research_human_message, compress_research_system_prompt
 from langchain_core.messages import AIMessage, ToolMessage, SystemMessage, HumanMessage, filter_messages
 from deep_research.research_state import ResearchState, ResearchOutput, LLMOutput, Summary
-from deep_research.tavily import tavily_search
+from deep_research.tavily import tavily_search, search_notes, local_search
+from deep_research.local_corpus import corpus_dir
+from deep_research.budget import budget_level, FORCE_COMPLETE
+from deep_research.utils import query_similarity
+from deep_research.profiling import profile_node, profile_graph
 from typing_extensions import Literal, Any
 from langgraph.graph import StateGraph, START, END
 from os import getenv
 from datetime import datetime
+import asyncio
 
-model = init_chat_model(model='x-ai/grok-4-fast:free', temperature=0.3, api_key=getenv('OPENROUTER_API_KEY'))
-compress_model = init_chat_model(model='x-ai/grok-4-fast:free', temperature=0.3, api_key=getenv('OPENROUTER_API_KEY'))
-tools = [tavily_search]
+model = init_model_chain('researcher', temperature=0.3, api_key=getenv('OPENROUTER_API_KEY'))
+compress_model = init_model_chain('compressor', temperature=0.3, api_key=getenv('OPENROUTER_API_KEY'))
+tools = [tavily_search, search_notes] + ([local_search] if corpus_dir else [])
 tools_by_name = {tool.name : tool for tool in tools}
 
+# Tool calls a single research agent may make before its findings are compressed
+max_tool_call_iterations = 8
+# Queries at least this similar to an earlier one reuse its result instead of searching again
+duplicate_query_threshold = 0.8
+
 def get_today_str():
     """return todays date in windows, different method for other os"""
     return datetime.now().strftime("%Y -%m -%d")
@@ -29,7 +39,7 @@ def format_tool_instructions(tools: list[Any]) -> str:
         tool_str += "<tool_info>\n"
     return tool_str
 
-def llm_call(state : ResearchState):
+async def llm_call(state : ResearchState):
     """
     Analyze current state and decide on next actions.
 
@@ -44,7 +54,7 @@ def llm_call(state : ResearchState):
     messages = [SystemMessage(content=research_agent_prompt.format(date=get_today_str(), tools_info=format_tool_instructions(tools)))] \
                + state['researcher_messages']
 
-    result = structured_model.invoke(messages)
+    result = await structured_model.ainvoke(messages)
 
     ai_message = AIMessage(
         content=result.research_message or "",
@@ -56,12 +66,65 @@ def llm_call(state : ResearchState):
     return {"researcher_messages": [ai_message]}
 
 
-def tool_node(state : ResearchState):
+def previous_searches(messages: list) -> list[tuple[str, str]]:
+    """Pair every earlier tavily_search query of the agent with the output it returned"""
+    outputs = {m.tool_call_id: str(m.content) for m in messages if isinstance(m, ToolMessage)}
+    return [
+        (tool_call['args'].get('query', ''), outputs[tool_call['id']])
+        for m in messages if isinstance(m, AIMessage)
+        for tool_call in m.tool_calls
+        if tool_call['name'] == 'tavily_search' and tool_call['id'] in outputs
+    ]
+
+def find_duplicate_search(query: str, searches: list[tuple[str, Any]]) -> tuple[str, Any] | None:
+    """Return the earlier (query, result) which is a repeat or near repeat of query"""
+    for earlier_query, result in searches:
+        if query_similarity(query, earlier_query) >= duplicate_query_threshold:
+            return earlier_query, result
+    return None
+
+async def tool_node(state : ResearchState):
+    """Execute the tool calls of the last AI message.
+
+    Calls beyond max_tool_call_iterations are answered with a budget notice
+    instead of running, and searches repeating an earlier query of this agent
+    are short-circuited with the earlier result.
+    """
     tool_calls = state['researcher_messages'][-1].tool_calls
-    observations = []
-    for tool_call in tool_calls:
-        tool = tools_by_name[tool_call['name']]
-        observations.append(tool.invoke(tool_call['args']))
+    iterations = state.get('tool_call_iterations', 0)
+    searches = previous_searches(state['researcher_messages'])
+    # searches started in this round, so repeats within one message share a single call
+    running = []
+
+    async def reuse(earlier_query, earlier):
+        result = earlier if isinstance(earlier, str) else await earlier
+        return f"Duplicate of the earlier search \"{earlier_query}\", reusing its result.\n\n{result}"
+
+    async def budget_exhausted():
+        return (
+            f"Tool call budget of {max_tool_call_iterations} calls exhausted, the call was not executed. "
+            "Stop searching, your findings will now be compressed."
+        )
+
+    tasks = []
+    for index, tool_call in enumerate(tool_calls):
+        if iterations + index >= max_tool_call_iterations:
+            tasks.append(asyncio.ensure_future(budget_exhausted()))
+            continue
+
+        if tool_call['name'] == 'tavily_search':
+            query = tool_call['args'].get('query', '')
+            duplicate = find_duplicate_search(query, searches) or find_duplicate_search(query, running)
+            if duplicate:
+                tasks.append(asyncio.ensure_future(reuse(*duplicate)))
+                continue
+
+        task = asyncio.ensure_future(tools_by_name[tool_call['name']].ainvoke(tool_call['args']))
+        if tool_call['name'] == 'tavily_search':
+            running.append((query, task))
+        tasks.append(task)
+
+    observations = await asyncio.gather(*tasks)
 
     tool_outputs = [
         ToolMessage(
@@ -71,15 +134,27 @@ def tool_node(state : ResearchState):
         ) for observation, tool_call in zip(observations, tool_calls)
     ]
 
-    return {'researcher_messages' : tool_outputs}
+    return {
+        'researcher_messages' : tool_outputs,
+        'tool_call_iterations' : iterations + len(tool_calls)
+    }
+
+def after_tools(state : ResearchState) -> Literal['llm_call', 'compress_research']:
+    """Force compression once the agent has spent its tool call budget"""
+    if state.get('tool_call_iterations', 0) >= max_tool_call_iterations:
+        return 'compress_research'
+    return 'llm_call'
 
 def should_continue(state : ResearchState) -> Literal['llm_call','compress_research']:
     last_message = state['researcher_messages'][-1]
+    # out of run budget, compress whatever was gathered so far
+    if budget_level() >= FORCE_COMPLETE:
+        return 'compress_research'
     if last_message.tool_calls:
         return 'tool_node'
     return 'compress_research'
 
-def compress_research(state: ResearchState) -> dict:
+async def compress_research(state: ResearchState) -> dict:
     """Compress research findings into a concise summary.
 
     Takes all the research messages and tool outputs and creates
@@ -88,8 +163,12 @@ def compress_research(state: ResearchState) -> dict:
     print('-----------------------------------compress research-------------------------------------')
     print(state)
     system_message = compress_research_system_prompt.format(date=get_today_str())
-    messages = [SystemMessage(content=system_message)] + state.get("researcher_messages", []) + [HumanMessage(content=compress_research_human_message)]
-    response = compress_model.invoke(messages)
+    researcher_messages = list(state.get("researcher_messages", []))
+    # compression can be forced while the last AI message still requests tools, drop the unanswered calls
+    if researcher_messages and isinstance(researcher_messages[-1], AIMessage) and researcher_messages[-1].tool_calls:
+        researcher_messages[-1] = AIMessage(content=researcher_messages[-1].content)
+    messages = [SystemMessage(content=system_message)] + researcher_messages + [HumanMessage(content=compress_research_human_message)]
+    response = await compress_model.ainvoke(messages)
 
     # Extract raw notes from tool and AI messages
     raw_notes = [
@@ -107,12 +186,19 @@ def compress_research(state: ResearchState) -> dict:
 
 graph_builder = StateGraph(ResearchState, output_schema=ResearchOutput)
 
-graph_builder.add_node('llm_call', llm_call)
-graph_builder.add_node('tool_node', tool_node)
-graph_builder.add_node('compress_research', compress_research)
+graph_builder.add_node('llm_call', profile_node(llm_call))
+graph_builder.add_node('tool_node', profile_node(tool_node))
+graph_builder.add_node('compress_research', profile_node(compress_research))
 
 graph_builder.add_edge(START, "llm_call")
-graph_builder.add_edge("tool_node", "llm_call")  # back to LLM after tool
+graph_builder.add_conditional_edges(
+    'tool_node',
+    after_tools,
+    {
+        "llm_call" : "llm_call",  # back to LLM after tool
+        "compress_research" : "compress_research"
+    }
+)
 
 graph_builder.add_conditional_edges(
     'llm_call',
@@ -124,4 +210,4 @@ graph_builder.add_conditional_edges(
 )
 graph_builder.add_edge("compress_research", END)
 
-research_agent = graph_builder.compile()
+research_agent = profile_graph(graph_builder.compile(), 'research_agent')
@@ -49,3 +49,18 @@ class Summary(BaseModel):
     """Schema for webpage content summarization."""
     summary: str = Field(description="Concise summary of the webpage content")
     key_excerpts: str = Field(description="Important quotes and excerpts from the content")
+
+
+class PageSummary(BaseModel):
+    """Summary of one webpage in a batched summarization call."""
+    url: str = Field(description="URL of the webpage exactly as given in the input")
+    summary: str = Field(description="Concise summary of the webpage content")
+    key_excerpts: str = Field(description="Important quotes and excerpts from the content")
+
+
+class BatchSummary(BaseModel):
+    """Schema for summarizing several webpages in one call."""
+    summaries: List[PageSummary] = Field(
+        default_factory=list,
+        description="One summary per webpage, keyed by its URL"
+    )
@@ -1,32 +1,77 @@
 
 from langchain_core.messages import BaseMessage, filter_messages, SystemMessage, AIMessage, HumanMessage, ToolMessage
 from deep_research.state_multi_agent_supervisor import SupervisorState, ConductResearch, ResearchComplete, SupervisorOutput
-from deep_research.openrouter import init_chat_model
+from deep_research.openrouter import init_model_chain
 from langgraph.types import Command
 from typing_extensions import Literal
 from deep_research.prompts import lead_researcher_prompt
 from deep_research.utils import get_today_str, format_tool_instructions
 from langgraph.graph import END, START, StateGraph
 from deep_research.research_agent import research_agent
+from deep_research.budget import get_run_budget, budget_level, REDUCE_PARALLELISM, SKIP_SUMMARIZATION, FORCE_COMPLETE
+from deep_research.notes_index import index_for_run, release_run_index, use_notes_index
+from deep_research.topic_cache import get_topic_cache
+from deep_research.workers import get_research_backend
+from deep_research.extractive import extractive_digest
+from deep_research.tavily import prefetch_search, speculative_queries, use_prefetch_run, release_prefetched_searches
+from deep_research.profiling import profile_node, profile_graph
 from os import getenv
+from contextlib import nullcontext
 import asyncio
+import math
+import uuid
 
-def get_notes_from_tool_calls(messages : list[BaseMessage]) -> list[str]:
-    """Extract research notes from ToolMessage objects in supervisor message history.
+def get_notes_from_ledger(research_ledger : dict[str, dict]) -> list[str]:
+    """Full research findings of the run, in the order the sub-agents returned them"""
+    return [note['content'] for note in research_ledger.values()]
 
-    This function retrieves the compressed research findings that sub-agents
-    return as ToolMessage content. When the supervisor delegates research to
-    sub-agents via ConductResearch tool calls, each sub-agent returns its
-    compressed findings as the content of a ToolMessage. This function
-    extracts all such ToolMessage content to compile the final research notes.
+def ledger_note(note_id : str, research_topic : str, result : dict, research_round : int) -> dict:
+    """Ledger entry for a finished sub-agent with the digest shown to the supervisor in later rounds"""
+    content = result.get('compressed_research', "Error Synthesizing research report")
+    return {
+        "id": note_id,
+        "research_topic": research_topic,
+        "content": content,
+        "digest": extractive_digest(content, research_topic, note_digest_sentences, note_digest_chars),
+        "partial": bool(result.get('partial', False)),
+        "round": research_round
+    }
 
-    Args:
-        messages: List of messages from supervisor's conversation history
+def note_reference(note : dict) -> str:
+    """Compact ToolMessage content standing in for a finding kept in the ledger"""
+    partial = " (partial)" if note['partial'] else ""
+    return (
+        f"[{note['id']}]{partial} Digest of findings on: {note['research_topic'][:150]}\n"
+        f"{note['digest']}\n"
+        f"(full findings are kept in the notes ledger under {note['id']})"
+    )
 
-    Returns:
-        List of research note strings extracted from ToolMessage objects
+def expand_latest_findings(messages : list[BaseMessage], research_ledger : dict[str, dict]) -> list[BaseMessage]:
+    """Replace the digests of the latest research round with the full findings from the ledger.
+
+    Findings of earlier rounds stay as digests plus note ids, so the supervisor
+    prompt grows by a few hundred tokens per finding instead of the full
+    compressed research.
     """
-    return [msg.content for msg in filter_messages(messages, include_types='tool')]
+    last_ai = max((i for i, m in enumerate(messages) if isinstance(m, AIMessage)), default=-1)
+    expanded = list(messages)
+    for i in range(last_ai + 1, len(messages)):
+        message = messages[i]
+        if isinstance(message, ToolMessage):
+            note_id = message.artifact.get('note_id') if isinstance(message.artifact, dict) else None
+        else:
+            # late results of pipelined runs arrive as human messages
+            note_id = message.additional_kwargs.get('note_id')
+        if note_id not in research_ledger:
+            continue
+        note = research_ledger[note_id]
+        partial = " (partial)" if note['partial'] else ""
+        content = f"[{note_id}]{partial} {note['content']}"
+        if isinstance(message, ToolMessage):
+            expanded[i] = ToolMessage(content=content, tool_call_id=message.tool_call_id, name=message.name, artifact=message.artifact)
+        else:
+            expanded[i] = HumanMessage(content=f"Late research result on: {note['research_topic'][:150]}\n{content}")
+    return expanded
 
 # Ensure async compatibility for Jupyter environments
 try:
@@ -42,11 +87,212 @@ except ImportError:
     pass  # nest_asyncio not available, proceed without it
 
 tools = [ConductResearch, ResearchComplete]
-supervisor_model = init_chat_model(model='x-ai/grok-4-fast:free', temperature=0.3, api_key=getenv('OPENROUTER_API_KEY'))
+supervisor_model = init_model_chain('supervisor', temperature=0.3, api_key=getenv('OPENROUTER_API_KEY'))
 
 max_concurrent_researchers = 3
 max_researcher_iterations = 6
 
+# Wall-clock seconds a single research sub-agent may run before it is cancelled
+research_agent_timeout = 300
+
+# Where sub-agents run: 'inprocess' as coroutines of the supervisor, 'process' on a local
+# process pool or 'sqlite' on the job queue of deep_research.workers
+research_backend = getenv('DEEP_RESEARCH_BACKEND', 'inprocess')
+
+# Size of the digest of an earlier finding the supervisor sees instead of its full text
+note_digest_sentences = 3
+note_digest_chars = 600
+
+# Pipelined runs (started with `pipeline_results` in their state) continue with the next
+# supervisor turn once this share of the running sub-agents returned, or after
+# pipeline_time_slice seconds, and merge later results into the following turns
+pipeline_quorum = 0.5
+pipeline_time_slice = 60
+
+# Sub-agents still running in pipelined runs, by run id and ConductResearch tool call id
+pending_research: dict[str, dict[str, dict]] = {}
+
+# Fire and forget tasks, referenced until they finish so they are not garbage collected
+background_tasks: set[asyncio.Task] = set()
+
+def partial_research_from_state(state : dict, reason : str) -> dict:
+    """Build a research result from whatever a sub-agent gathered before it was stopped.
+
+    The search tool already returns summarized sources, so the tool outputs collected
+    so far are used as the compressed findings when the agent never reached
+    compress_research.
+
+    Args:
+        state: Latest state streamed from the research agent
+        reason: Why the agent was stopped, shown to the supervisor
+
+    Returns:
+        Dictionary with compressed_research and raw_notes like a finished agent,
+        flagged as partial
+    """
+    if state.get('compressed_research'):
+        return {
+            "compressed_research": state['compressed_research'],
+            "raw_notes": state.get('raw_notes', []),
+            "partial": True
+        }
+
+    messages = state.get('researcher_messages', [])
+    findings = [str(m.content) for m in filter_messages(messages, include_types=['tool']) if m.content]
+    raw_notes = [str(m.content) for m in filter_messages(messages, include_types=['tool', 'ai']) if m.content]
+    if not findings:
+        findings = ["No findings were gathered before the sub-agent was stopped."]
+
+    return {
+        "compressed_research": f"[Partial research: {reason}]\n\n" + "\n\n".join(findings),
+        "raw_notes": ["\n".join(raw_notes)] if raw_notes else [],
+        "partial": True
+    }
+
+def format_seconds(seconds : float) -> str:
+    """Seconds for messages, with decimals only where whole seconds would hide them"""
+    return f"{seconds:.0f}s" if seconds >= 10 else f"{seconds:.2g}s"
+
+def research_deadline() -> float:
+    """Sub-agent deadline in seconds, capped by the wall-clock budget left for the run"""
+    timeout = research_agent_timeout
+    budget = get_run_budget()
+    if budget is not None and budget.remaining_seconds() is not None:
+        timeout = min(timeout, budget.remaining_seconds())
+    return timeout
+
+async def run_research_agent(research_topic : str, timeout : float = None) -> dict:
+    """Run one research sub-agent with a wall-clock deadline.
+
+    The agent is streamed so its latest state is known at any point. When the
+    deadline passes the agent is cancelled and its partial findings are returned
+    instead of discarding everything it gathered.
+
+    Args:
+        research_topic: Topic delegated by the supervisor
+        timeout: Deadline in seconds, defaults to research_agent_timeout
+
+    Returns:
+        Research agent output with compressed_research and raw_notes
+    """
+    timeout = research_deadline() if timeout is None else timeout
+    latest_state = {}
+    try:
+        async with asyncio.timeout(timeout):
+            async for latest_state in research_agent.astream({
+                "researcher_messages" : HumanMessage(content = research_topic),
+                "research_topic" : research_topic
+            }, stream_mode="values"):
+                pass
+    except TimeoutError:
+        print(f"Research agent exceeded its {format_seconds(timeout)} deadline, returning partial results")
+        return partial_research_from_state(latest_state, f"sub-agent stopped after its {format_seconds(timeout)} deadline")
+    return latest_state
+
+async def dispatch_research_agent(job_id : str, research_topic : str) -> dict:
+    """Run a research sub-agent on the configured research_backend.
+
+    Args:
+        job_id: Key the result is returned under by remote backends, run id and tool call id
+        research_topic: Topic delegated by the supervisor
+
+    Returns:
+        Research agent output with compressed_research and raw_notes
+    """
+    if research_backend == 'inprocess':
+        return await run_research_agent(research_topic)
+    return await get_research_backend(research_backend).run(job_id, research_topic, research_deadline())
+
+async def run_cached_research_agent(job_id : str, research_topic : str, use_topic_cache : bool = False) -> dict:
+    """Serve a research topic from the cross-run topic cache, or research it and cache the result.
+
+    Args:
+        job_id: Key of the sub-agent job, run id and tool call id
+        research_topic: Topic delegated by the supervisor
+        use_topic_cache: Whether this run opted in to the topic cache
+
+    Returns:
+        Research agent output with compressed_research and raw_notes
+    """
+    if not use_topic_cache:
+        return await dispatch_research_agent(job_id, research_topic)
+
+    # SQLite lookups, and the similarity scan of a miss, run off the event loop
+    cache = await asyncio.to_thread(get_topic_cache)
+    cached = await asyncio.to_thread(cache.get, research_topic)
+    if cached is not None:
+        print(f"Topic cache hit for research topic: {cached['research_topic'][:80]}")
+        return cached
+
+    result = await dispatch_research_agent(job_id, research_topic)
+    # the budget level only rises during a run, so a level reached by now may have cut
+    # the agent short (forced compression) or left it with search snippets only
+    if budget_level() >= SKIP_SUMMARIZATION:
+        result = {**result, 'degraded': True}
+    # partial results of a timed out agent and degraded results are not worth serving to later runs
+    if not result.get('partial') and not result.get('degraded'):
+        await asyncio.to_thread(cache.put, research_topic, result)
+    return result
+
+async def start_prefetch(conduct_research_calls : list[dict], state : SupervisorState) -> list[asyncio.Task]:
+    """Start speculative searches for the dispatched topics while their agents make their first model call.
+
+    Queries are derived locally from each topic, and their searches and summaries
+    land in the caches of deep_research.tavily. Must be called inside
+    use_prefetch_run, only the agents of that run are served the prefetched
+    searches. Only in-process agents share these caches, topics served by the
+    topic cache are skipped.
+
+    Args:
+        conduct_research_calls: ConductResearch tool calls being dispatched
+        state: Current supervisor state
+
+    Returns:
+        Tasks of the running prefetches
+    """
+    if research_backend != 'inprocess':
+        return []
+    tasks = []
+    for tool_call in conduct_research_calls:
+        research_topic = tool_call['args']['research_topic']
+        if state.get('use_topic_cache', False):
+            cache = await asyncio.to_thread(get_topic_cache)
+            if await asyncio.to_thread(cache.get, research_topic) is not None:
+                continue
+        for query in speculative_queries(research_topic):
+            tasks.append(asyncio.ensure_future(asyncio.to_thread(prefetch_search, query)))
+    return tasks
+
+def keep_in_background(tasks : list[asyncio.Task]):
+    """Let tasks finish on their own without awaiting them"""
+    for task in tasks:
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+def abandon_run(run_id : str):
+    """Cancel the sub-agents a failed or cancelled run still has running and release its notes index"""
+    for entry in pending_research.pop(run_id, {}).values():
+        entry['task'].cancel()
+    release_run_index(run_id)
+    release_prefetched_searches(run_id)
+
+def task_outcome(task : asyncio.Task):
+    """Result of a finished task, or the exception it failed with"""
+    if task.cancelled():
+        return asyncio.CancelledError("research sub-agent was cancelled")
+    return task.exception() or task.result()
+
+async def wait_for_quorum(tasks : list[asyncio.Task]):
+    """Wait until pipeline_quorum of the tasks finished or pipeline_time_slice seconds passed"""
+    needed = max(1, math.ceil(pipeline_quorum * len(tasks)))
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + pipeline_time_slice
+    while sum(task.done() for task in tasks) < needed:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        await asyncio.wait([task for task in tasks if not task.done()], timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+
 async def supervisor(state : SupervisorState) -> Command[Literal['supervisor_tools']]:
     """Coordinate research activities.
 
@@ -63,6 +309,21 @@ async def supervisor(state : SupervisorState) -> Command[Literal['supervisor_too
     """
     print('---------------------------------------STATE-----------------------------------------------------')
     print(state)
+
+    # out of run budget, complete with the findings so far instead of asking the model
+    if budget_level() >= FORCE_COMPLETE:
+        ai_message = AIMessage(
+            content="Run budget exhausted, completing research with the findings gathered so far.",
+            tool_calls=[{"name": "ResearchComplete", "args": {}, "id": f"budget-{uuid.uuid4()}"}]
+        )
+        return Command(
+            goto="supervisor_tools",
+            update={
+                "supervisor_messages" : [ai_message],
+                "research_iterations" : state.get('research_iterations', 0) + 1
+            }
+        )
+
     structured_model = supervisor_model.with_structured_output(SupervisorOutput)
     system_message = lead_researcher_prompt.format(
         date=get_today_str(),
@@ -71,9 +332,16 @@ async def supervisor(state : SupervisorState) -> Command[Literal['supervisor_too
         max_researcher_iterations=max_researcher_iterations
     )
 
-    messages = [SystemMessage(content=system_message)] + state.get('supervisor_messages', [])
+    supervisor_messages = expand_latest_findings(state.get('supervisor_messages', []), state.get('research_ledger', {}))
+    messages = [SystemMessage(content=system_message)] + supervisor_messages
 
-    result = await structured_model.ainvoke(messages)
+    try:
+        result = await structured_model.ainvoke(messages)
+    except BaseException:
+        # the run fails or is cancelled here, its sub-agents must not keep spending budget
+        if state.get('run_id'):
+            abandon_run(state['run_id'])
+        raise
     print('-------------------------------------------supervisor_result---------------------------------------------')
     print(result)
     ai_message = AIMessage(content=result.message, tool_calls=result.tool_calls)
@@ -100,15 +368,60 @@ async def supervisor_tools(state : SupervisorState) -> Command[Literal['supervis
     Returns:
         Command to continue supervision, end process, or handle errors
     """
+    # identifies the run across supervisor rounds, e.g. for its shared notes index
+    run_id = state.get('run_id') or str(uuid.uuid4())
+    try:
+        return await execute_supervisor_tools(state, run_id)
+    except BaseException:
+        # the run fails or is cancelled, e.g. a service job deleted mid-round
+        abandon_run(run_id)
+        raise
 
+async def execute_supervisor_tools(state : SupervisorState, run_id : str) -> Command[Literal['supervisor', '__end__']]:
+    """Body of supervisor_tools, run under the cleanup of its run"""
     supervisor_messages = state.get('supervisor_messages',[])
     research_iterations = state.get('research_iterations',0)
     most_recent_message = supervisor_messages[-1]
 
+    research_ledger = state.get('research_ledger', {})
     tool_messages = []
+    late_messages = []
     all_raw_notes = []
+    new_notes = {}
     next_step = 'supervisor'
     should_end = False
+    # pipelined runs keep slow sub-agents running across rounds instead of waiting for all of them
+    pipelined = state.get('pipeline_results', False)
+    pending = pending_research.setdefault(run_id, {}) if pipelined else {}
+
+    def add_result(tool_call : dict, result, research_round : int, late : bool = False):
+        """Record a finished sub-agent in the ledger and answer it with a message"""
+        if isinstance(result, BaseException):
+            print(f"Research agent failed: {result}")
+            content = f"Error: research sub-agent failed ({type(result).__name__}: {result})"
+            if late:
+                late_messages.append(HumanMessage(content=f"Late result of ConductResearch call {tool_call['id']}: {content}"))
+            else:
+                tool_messages.append(ToolMessage(content=content, tool_call_id=tool_call['id'], name=tool_call['name'], status='error'))
+            return
+
+        # the finding is stored once in the ledger, the message only carries its digest
+        note_id = f"note-{len(research_ledger) + len(new_notes) + 1}"
+        note = ledger_note(note_id, tool_call['args']['research_topic'], result, research_round)
+        new_notes[note_id] = note
+        if late:
+            late_messages.append(HumanMessage(
+                content=f"Late result of ConductResearch call {tool_call['id']}:\n{note_reference(note)}",
+                additional_kwargs={"note_id": note_id}
+            ))
+        else:
+            tool_messages.append(ToolMessage(
+                content = note_reference(note),
+                tool_call_id=tool_call['id'],
+                name=tool_call['name'],
+                artifact={"note_id": note_id}
+            ))
+        all_raw_notes.append('\n'.join(result.get('raw_notes', [])))
 
     exceeded_iterations = research_iterations >= max_researcher_iterations
     no_tool_calls = not most_recent_message.tool_calls
@@ -126,43 +439,92 @@ async def supervisor_tools(state : SupervisorState) -> Command[Literal['supervis
                 if tool_call['name'] == 'ConductResearch'
             ]
 
-            if conduct_research_calls:
-                coros = [
-                    research_agent.ainvoke({
-                        "researcher_messages" : HumanMessage(content = tool_call['args']['research_topic']),
-                        "research_topic" : tool_call['args']['research_topic']
-                    })
-                    for tool_call in most_recent_message.tool_calls
-                ]
-
-                tool_results = await asyncio.gather(*coros)
-                print('----------------------------------------------Tool Results-----------------------------------------')
-                print(tool_results)
+            # run fewer sub-agents in parallel as the run budget gets low, counting
+            # the ones still running from earlier rounds of a pipelined run
+            max_parallel = 1 if budget_level() >= REDUCE_PARALLELISM else max_concurrent_researchers
+            available = max(0, max_parallel - len(pending))
+            still_running = f" and {len(pending)} are still running" if pending else ""
+            for tool_call in conduct_research_calls[available:]:
+                tool_messages.append(ToolMessage(
+                    content = f"Not run: at most {max_parallel} research units can run in parallel right now{still_running}. Delegate this topic again in a later round if it is still needed.",
+                    tool_call_id=tool_call['id'],
+                    name=tool_call['name'],
+                    status='error'
+                ))
+            conduct_research_calls = conduct_research_calls[:available]
 
-                research_tool_messages = [
-                    ToolMessage(
-                        content = result.get('compressed_research', "Error Synthesizing research report"),
-                        id=tool_call['id'],
-                        name=tool_call['name']
-                    ) for result, tool_call in zip(tool_results, conduct_research_calls)
+            if conduct_research_calls or pending:
+                coros = [
+                    run_cached_research_agent(
+                        f"{run_id}:{tool_call['id']}",
+                        tool_call['args']['research_topic'],
+                        state.get('use_topic_cache', False)
+                    )
+                    for tool_call in conduct_research_calls
                 ]
 
-                tool_messages.extend(research_tool_messages)
+                # a failing sub-agent must not discard the results of its siblings,
+                # all of them share the run's notes index for the search_notes tool
+                # and, when the run opted in, its prefetched searches
+                prefetching = state.get('prefetch_searches', False)
+                with use_notes_index(index_for_run(run_id)), (use_prefetch_run(run_id) if prefetching else nullcontext()):
+                    prefetches = await start_prefetch(conduct_research_calls, state) if prefetching else []
+                    if pipelined:
+                        for tool_call, coro in zip(conduct_research_calls, coros):
+                            pending[tool_call['id']] = {
+                                "task": asyncio.ensure_future(coro),
+                                "tool_call": tool_call,
+                                "round": research_iterations
+                            }
+                        keep_in_background(prefetches)
+                        await wait_for_quorum([entry['task'] for entry in pending.values()])
+                    else:
+                        tool_results = await asyncio.gather(*coros, return_exceptions=True)
+                        await asyncio.gather(*prefetches, return_exceptions=True)
 
-                all_raw_notes = [
-                    '\n'.join(result.get('raw_notes', []))
-                    for result in tool_results
-                ]
+                if pipelined:
+                    for tool_call in conduct_research_calls:
+                        task = pending[tool_call['id']]['task']
+                        if task.done():
+                            add_result(tool_call, task_outcome(task), research_iterations)
+                            del pending[tool_call['id']]
+                        else:
+                            tool_messages.append(ToolMessage(
+                                content = "Research on this topic is still running, its findings will be added in a later turn.",
+                                tool_call_id=tool_call['id'],
+                                name=tool_call['name'],
+                                artifact={"pending": True}
+                            ))
+                    for tool_call_id, entry in list(pending.items()):
+                        if entry['task'].done():
+                            add_result(entry['tool_call'], task_outcome(entry['task']), entry['round'], late=True)
+                            del pending[tool_call_id]
+                else:
+                    print('----------------------------------------------Tool Results-----------------------------------------')
+                    print(tool_results)
+                    for result, tool_call in zip(tool_results, conduct_research_calls):
+                        add_result(tool_call, result, research_iterations)
         except Exception as e:
             print(f"Error in supervisor tools: {e}")
             should_end = True
             next_step = END
 
     if should_end:
+        # results of sub-agents still running in a pipelined run are awaited so no finding is lost
+        if pending:
+            entries = list(pending.values())
+            outcomes = await asyncio.gather(*(entry['task'] for entry in entries), return_exceptions=True)
+            for entry, outcome in zip(entries, outcomes):
+                add_result(entry['tool_call'], outcome, entry['round'], late=True)
+        pending_research.pop(run_id, None)
+        release_run_index(run_id)
+        release_prefetched_searches(run_id)
         return Command(
             goto=next_step,
             update={
-                "notes": get_notes_from_tool_calls(supervisor_messages),
+                "notes": get_notes_from_ledger({**research_ledger, **new_notes}),
+                "raw_notes": all_raw_notes,
+                "research_ledger": new_notes,
                 "research_brief": state.get("research_brief", "")
             }
         )
@@ -170,13 +532,15 @@ async def supervisor_tools(state : SupervisorState) -> Command[Literal['supervis
         return Command(
             goto=next_step,
             update={
-                "supervisor_messages": tool_messages,
-                "raw_notes": all_raw_notes
+                "supervisor_messages": tool_messages + late_messages,
+                "raw_notes": all_raw_notes,
+                "research_ledger": new_notes,
+                "run_id": run_id
             }
         )
 
 supervisor_builder = StateGraph(SupervisorState)
-supervisor_builder.add_node('supervisor', supervisor)
-supervisor_builder.add_node('supervisor_tools', supervisor_tools)
+supervisor_builder.add_node('supervisor', profile_node(supervisor))
+supervisor_builder.add_node('supervisor_tools', profile_node(supervisor_tools))
 supervisor_builder.add_edge(START, 'supervisor')
-supervisor_agent = supervisor_builder.compile() 
+supervisor_agent = profile_graph(supervisor_builder.compile(), 'supervisor')
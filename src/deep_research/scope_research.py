@@ -12,7 +12,8 @@ from langchain_core.messages import HumanMessage, get_buffer_string, AIMessage
 from datetime import datetime
 from langgraph.graph import StateGraph, START, END
 from dotenv import load_dotenv
-from deep_research.openrouter import init_chat_model
+from deep_research.openrouter import init_model_chain
+from deep_research.profiling import profile_node, profile_graph
 
 load_dotenv()
 
@@ -20,7 +21,7 @@ def get_today_str():
     """return todays date in windows, different method for other os"""
     return datetime.now().strftime("%Y -%m -%d")
 
-model = init_chat_model(model = "x-ai/grok-4-fast:free", api_key=os.getenv('OPENAI_API_KEY'), temperature=0)
+model = init_model_chain("scoper", api_key=os.getenv('OPENAI_API_KEY'), temperature=0)
 
 def clarify_with_user(state : AgentState)-> Command[Literal["write_research_brief", "__end__"]]:
     """
@@ -73,10 +74,10 @@ def write_research_brief(state : AgentState):
 
 deep_research_builder = StateGraph(AgentState, input_schema = AgentInputState)
 
-deep_research_builder.add_node('clarify_with_user', clarify_with_user)
-deep_research_builder.add_node('write_research_brief', write_research_brief)
+deep_research_builder.add_node('clarify_with_user', profile_node(clarify_with_user))
+deep_research_builder.add_node('write_research_brief', profile_node(write_research_brief))
 
 deep_research_builder.add_edge(START, 'clarify_with_user')
 deep_research_builder.add_edge('write_research_brief', END)
 
-scope_research = deep_research_builder.compile()
+scope_research = profile_graph(deep_research_builder.compile(), 'scope_research')
@@ -0,0 +1,405 @@
+"""
+Long running ASGI service for deep research jobs.
+
+The graph modules, chat models and Tavily client are loaded once when the service
+starts and shared by all jobs. Jobs are accepted into a bounded queue and run by a
+fixed number of workers, so the number of concurrent research runs is capped and
+requests are rejected with 429 when the queue is full.
+
+    pip install 'deep-research-opensource[service]'
+    uvicorn deep_research.service:app --port 8000
+    python -m deep_research.service --port 8000
+
+Endpoints:
+    POST   /jobs               submit {"query": "..."} or {"messages": [{"role": "user", "content": "..."}]},
+                               optional "budget" {"max_seconds", "max_tokens", "max_search_calls"}
+                               and "use_topic_cache"
+    GET    /jobs/{id}          job status and result
+    GET    /jobs/{id}/events   progress as server-sent events
+    DELETE /jobs/{id}          cancel a job
+    GET    /health             queue and concurrency status
+"""
+
+from deep_research.scope_research import scope_research
+from deep_research.research_supervisor import supervisor_agent
+from deep_research.budget import RunBudget, use_run_budget
+from langchain_core.messages import HumanMessage, AIMessage
+from contextlib import nullcontext
+from typing_extensions import Optional, Any
+from os import getenv
+import argparse
+import asyncio
+import json
+import math
+import re
+import time
+import uuid
+
+# Research runs executed at the same time
+max_concurrent_jobs = int(getenv('DEEP_RESEARCH_MAX_CONCURRENT_JOBS', 4))
+
+# Jobs waiting for a free worker before new submissions are rejected
+max_queued_jobs = int(getenv('DEEP_RESEARCH_MAX_QUEUED_JOBS', 32))
+
+# Seconds finished jobs are kept for status and event queries
+finished_job_ttl = 3600
+
+FINISHED_STATUSES = ('done', 'needs_clarification', 'failed', 'cancelled')
+
+# Limits a job may set in its "budget", see RunBudget
+BUDGET_KEYS = ('max_seconds', 'max_tokens', 'max_search_calls')
+
+
+class Job:
+    """One research request with its progress events and result"""
+
+    def __init__(self, messages: list, budget: Optional[dict] = None, use_topic_cache: bool = False):
+        self.id = str(uuid.uuid4())
+        self.messages = messages
+        self.budget = budget
+        self.use_topic_cache = use_topic_cache
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.events: list[dict] = []
+        self.task: Optional[asyncio.Task] = None
+        self._subscribers: set[asyncio.Queue] = set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def emit(self, event: str, data: Any):
+        entry = {"id": len(self.events), "event": event, "data": data}
+        self.events.append(entry)
+        for subscriber in self._subscribers:
+            subscriber.put_nowait(entry)
+
+    def set_status(self, status: str):
+        self.status = status
+        if self.finished:
+            self.finished_at = time.time()
+        self.emit('status', {"status": status})
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue receiving all past and future events of the job"""
+        queue = asyncio.Queue()
+        for entry in self.events:
+            queue.put_nowait(entry)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class QueueFull(Exception):
+    pass
+
+
+class ResearchService:
+    """Bounded job queue with a fixed pool of workers running scope_research and supervisor_agent"""
+
+    def __init__(self, max_concurrent: int = None, max_queued: int = None):
+        self.max_concurrent = max_concurrent or max_concurrent_jobs
+        self.max_queued = max_queued or max_queued_jobs
+        self.jobs: dict[str, Job] = {}
+        self.running = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrent)]
+
+    async def stop(self):
+        for job in self.jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, job: Job) -> Job:
+        """Admit a job into the queue, raises QueueFull when the service is saturated"""
+        self._forget_finished()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f"{self.max_queued} jobs are already waiting")
+        self.jobs[job.id] = job
+        job.emit('status', {"status": job.status, "queue_position": self.queued})
+        return job
+
+    def cancel(self, job: Job):
+        if job.finished:
+            return
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # still queued, the worker skips it
+            job.set_status('cancelled')
+
+    def _forget_finished(self):
+        oldest = time.time() - finished_job_ttl
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished and job.finished_at < oldest]:
+            del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if job.finished:
+                continue
+            self.running += 1
+            job.task = asyncio.create_task(self._run(job))
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                if not job.task.cancelled():
+                    raise
+            finally:
+                self.running -= 1
+                # a task cancelled before its first step never runs _run's handlers
+                if not job.finished:
+                    job.set_status('cancelled')
+
+    async def _run(self, job: Job):
+        job.started_at = time.time()
+        job.set_status('running')
+        budget = RunBudget(**job.budget) if job.budget else None
+        try:
+            with use_run_budget(budget) if budget else nullcontext():
+                await self._research(job)
+        except asyncio.CancelledError:
+            job.set_status('cancelled')
+        except Exception as e:
+            print(f"Research job {job.id} failed: {e}")
+            job.error = f"{type(e).__name__}: {e}"
+            job.set_status('failed')
+        finally:
+            if budget is not None:
+                job.emit('budget', budget.usage())
+
+    async def _research(self, job: Job):
+        scope = await scope_research.ainvoke({"messages": job.messages})
+        research_brief = scope.get("research_brief")
+        if not research_brief:
+            job.result = {"clarification": str(scope["messages"][-1].content)}
+            job.set_status('needs_clarification')
+            return
+        job.emit('brief', {"research_brief": research_brief})
+
+        final_state = {}
+        async for mode, chunk in supervisor_agent.astream({
+            "supervisor_messages": [HumanMessage(content=research_brief)],
+            "research_brief": research_brief,
+            "use_topic_cache": job.use_topic_cache,
+        }, stream_mode=["updates", "values"]):
+            if mode == "values":
+                final_state = chunk
+                continue
+            for node, update in (chunk or {}).items():
+                job.emit('progress', describe_update(node, update))
+
+        job.result = {
+            "research_brief": research_brief,
+            "notes": final_state.get("notes", []),
+            "raw_notes": final_state.get("raw_notes", []),
+        }
+        job.set_status('done')
+
+
+def describe_update(node: str, update: Any) -> dict:
+    """Compact progress event for a supervisor graph update"""
+    event = {"node": node}
+    messages = (update or {}).get("supervisor_messages", []) if isinstance(update, dict) else []
+    for message in messages:
+        if isinstance(message, AIMessage) and message.tool_calls:
+            event["tool_calls"] = [
+                {"name": call["name"], "research_topic": call["args"].get("research_topic", "")[:200]}
+                for call in message.tool_calls
+            ]
+        elif getattr(message, "type", None) == "tool":
+            event.setdefault("results", []).append({"name": message.name, "status": message.status, "chars": len(str(message.content))})
+    return event
+
+
+def parse_budget(body: dict) -> Optional[dict]:
+    budget = body.get("budget")
+    if budget is None:
+        return None
+    if not isinstance(budget, dict):
+        raise ValueError('"budget" must be an object')
+    unknown = sorted(set(budget) - set(BUDGET_KEYS))
+    if unknown:
+        raise ValueError(f'Unknown budget keys {unknown}, expected any of {list(BUDGET_KEYS)}')
+    for key, value in budget.items():
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value <= 0:
+            raise ValueError(f'Budget "{key}" must be a positive number, got {json.dumps(value)}')
+    return budget or None
+
+
+def parse_messages(body: dict) -> list:
+    if body.get("query"):
+        return [HumanMessage(content=str(body["query"]))]
+    messages = []
+    for message in body.get("messages") or []:
+        content = str(message.get("content", ""))
+        messages.append(AIMessage(content=content) if message.get("role") in ("assistant", "ai") else HumanMessage(content=content))
+    if not messages:
+        raise ValueError('Provide either "query" or a non-empty "messages" list')
+    return messages
+
+
+class ResearchApp:
+    """ASGI application exposing a ResearchService over HTTP"""
+
+    def __init__(self, service: ResearchService = None):
+        self.service = service or ResearchService()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.service.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.service.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        method, path = scope["method"], scope["path"].rstrip("/")
+        job_match = re.fullmatch(r"/jobs/([\w-]+)(/events)?", path)
+
+        if path == "/health" and method == "GET":
+            return await send_json(send, 200, {
+                "running": self.service.running,
+                "queued": self.service.queued,
+                "max_concurrent": self.service.max_concurrent,
+                "max_queued": self.service.max_queued,
+            })
+
+        if path == "/jobs" and method == "POST":
+            try:
+                body = json.loads(await read_body(receive) or b"{}")
+                if not isinstance(body, dict):
+                    raise ValueError("Request body must be a JSON object")
+                job = Job(parse_messages(body), parse_budget(body), bool(body.get("use_topic_cache", False)))
+            except (ValueError, TypeError) as e:
+                return await send_json(send, 400, {"error": str(e)})
+            try:
+                self.service.submit(job)
+            except QueueFull as e:
+                return await send_json(send, 429, {"error": f"Service saturated, {e}"}, headers=[(b"retry-after", b"30")])
+            return await send_json(send, 202, {"job_id": job.id, "status": job.status, "queue_position": self.service.queued})
+
+        if job_match:
+            job = self.service.jobs.get(job_match.group(1))
+            if job is None:
+                return await send_json(send, 404, {"error": "Unknown job"})
+            if job_match.group(2) and method == "GET":
+                return await self._events(job, receive, send)
+            if method == "GET":
+                return await send_json(send, 200, job.to_dict())
+            if method == "DELETE":
+                self.service.cancel(job)
+                return await send_json(send, 202, {"job_id": job.id, "status": job.status})
+
+        await send_json(send, 404, {"error": "Not found"})
+
+    async def _events(self, job: Job, receive, send):
+        """Stream job events as server-sent events until the job finishes or the client leaves"""
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+        })
+        queue = job.subscribe()
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            while True:
+                next_event = asyncio.ensure_future(queue.get())
+                await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    next_event.cancel()
+                    return
+                entry = next_event.result()
+                payload = f"id: {entry['id']}\nevent: {entry['event']}\ndata: {json.dumps(entry['data'], default=str)}\n\n"
+                await send({"type": "http.response.body", "body": payload.encode(), "more_body": True})
+                if job.finished and queue.empty():
+                    break
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            job.unsubscribe(queue)
+            disconnected.cancel()
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def send_json(send, status: int, data: dict, headers: list = None):
+    body = json.dumps(data, default=str).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + (headers or []),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+app = ResearchApp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve deep research jobs over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("uvicorn is required to run the service: pip install 'deep-research-opensource[service]'")
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,12 @@ class SupervisorState(TypedDict):
     notes : Annotated[list[str], operator.add] = []
     research_iterations : int = 0
     raw_notes : Annotated[list[str], operator.add] = []
+    run_id : str
+    use_topic_cache : bool = False
+    prefetch_searches : bool = False
+    pipeline_results : bool = False
+    # findings of the sub-agents keyed by note id, the messages only carry their digests
+    research_ledger : Annotated[dict[str, dict], operator.or_] = {}
 
 class SupervisorOutput(BaseModel):
     """
@@ -1,14 +1,29 @@
 
 from tavily import TavilyClient
 from dotenv import load_dotenv
-from typing_extensions import List, Literal, Annotated
-from deep_research.openrouter import init_chat_model
+from typing_extensions import List, Literal, Annotated, Any, Callable, Hashable, Optional
+from deep_research.openrouter import init_model_chain
 from os import getenv
-from deep_research.prompts import summarize_webpage_prompt
+from deep_research.prompts import summarize_webpage_prompt, summarize_webpages_batch_prompt
 from langchain_core.tools import tool, InjectedToolArg
 from datetime import datetime
-from deep_research.research_state import Summary
+from deep_research.research_state import Summary, BatchSummary
+from deep_research.budget import budget_level, charge_search, SKIP_SUMMARIZATION
+from deep_research.utils import normalize_query, estimate_tokens, query_similarity
+from deep_research.extractive import extractive_summary
+from deep_research.ranking import rank_search_results
+from deep_research.notes_index import get_notes_index
+from deep_research.cassette import get_cassette
+from deep_research.local_corpus import get_local_corpus
 from langchain_core.messages import HumanMessage
+from concurrent.futures import Future
+from collections import OrderedDict, Counter
+from contextvars import ContextVar
+from contextlib import contextmanager
+from abc import ABC, abstractmethod
+import hashlib
+import threading
+import time
 load_dotenv()
 
 def get_today_str():
@@ -16,11 +31,279 @@ def get_today_str():
     return datetime.now().strftime("%Y -%m -%d")
 
 # define the model
-summary_model = init_chat_model(model='qwen/qwen3-4b:free', temperature=0.3, api_key=getenv('OPENROUTER_API_KEY'))
+summary_model = init_model_chain('summarizer', temperature=0.3, api_key=getenv('OPENROUTER_API_KEY'))
 
 # init tavily_client
 tavily_client = TavilyClient(api_key=getenv('TAVILY_API_KEY'))
 
+# Relevance filter: only the summarize_top_k best ranked results (None for no limit)
+# scoring at least min_relevance_score are summarized, the rest keep their snippet
+summarize_top_k = 3
+min_relevance_score = 0.2
+
+# Summarization policy: only the best ranked pages of a search that are long enough
+# to be worth it go to the summarization model, all others are summarized locally
+llm_summary_top_k = 2
+min_llm_summary_chars = 2000
+
+# Approximate token budget of one tavily_search output, which is re-sent on every later
+# model call of the agent, and the summary tokens kept per source before dropping sources
+max_search_output_tokens = 2500
+min_source_tokens = 120
+
+# Batched summarization: the pages of a search that go to the summarization model are
+# packed into shared calls of about this many input tokens instead of one call per page.
+# The llm_summary_top_k and summarize_top_k caps do not apply to the model pages then,
+# the best ranked long pages are taken until one batch is full
+batch_summaries = getenv('DEEP_RESEARCH_BATCH_SUMMARIES', '').lower() in ('1', 'true', 'yes')
+max_batch_summary_tokens = 12000
+
+# Seconds and number of entries completed summaries and prefetched searches are kept
+result_cache_ttl = 600
+result_cache_size = 512
+
+# Speculative prefetch: minimum word set similarity of an agent's query to a prefetched
+# query of its run for the prefetched search to be used in its place
+prefetch_match_threshold = 0.6
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one call whose result is shared.
+
+    The first caller for a key runs the function, callers arriving while it is
+    still in flight wait for the same future instead of repeating the work.
+    Nothing is kept once the call finishes, so this is not a cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+class ResultCache:
+    """Thread safe cache of completed results that expire after `ttl` seconds.
+
+    Holds at most `maxsize` entries, evicting the least recently used one.
+    """
+
+    def __init__(self, ttl: float = result_cache_ttl, maxsize: int = result_cache_size):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def add(self, key: Hashable, value: Any) -> bool:
+        """Put `value` unless a fresh entry exists, returns whether it was added"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] >= time.monotonic():
+                return False
+        self.put(key, value)
+        return True
+
+    def pop(self, key: Hashable) -> Any:
+        """Remove an entry, returns its value if it was still fresh"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def keys(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [key for key, (_, expires) in self._entries.items() if expires >= now]
+
+search_flight = SingleFlight()
+summary_flight = SingleFlight()
+
+# Summaries by content hash, pages reached again by a later search are not re-summarized
+summary_cache = ResultCache()
+
+# Futures of speculative searches started by prefetch_search, keyed by prefetch_key
+prefetched_searches = ResultCache()
+
+# Run whose prefetched searches the current context may use, see use_prefetch_run
+_prefetch_run: ContextVar[Optional[str]] = ContextVar('prefetch_run', default=None)
+
+# Prefetched searches 'started', 'used' by an agent, 'unused' when their run ended and 'failed'
+prefetch_stats: Counter = Counter()
+_prefetch_stats_lock = threading.Lock()
+
+def count_prefetch(outcome: str, count: int = 1):
+    with _prefetch_stats_lock:
+        prefetch_stats[outcome] += count
+
+def prefetch_hit_rate() -> Optional[float]:
+    """Share of the prefetched searches an agent used, None before any prefetch"""
+    with _prefetch_stats_lock:
+        started = prefetch_stats['started']
+        return prefetch_stats['used'] / started if started else None
+
+@contextmanager
+def use_prefetch_run(run_id: str):
+    """Let prefetch_search and the searches inside the block share the prefetches of run `run_id`"""
+    token = _prefetch_run.set(run_id)
+    try:
+        yield
+    finally:
+        _prefetch_run.reset(token)
+
+def release_prefetched_searches(run_id: str):
+    """Drop the prefetched searches of a finished run that no agent asked for"""
+    for key in prefetched_searches.keys():
+        if key[0] == run_id and prefetched_searches.pop(key) is not None:
+            count_prefetch('unused')
+
+def prefetch_key(run_id: str, query: str, max_results: int, topic: str, include_raw_content: bool) -> tuple:
+    """Key of a prefetched search, queries with the same words in any order share it"""
+    words = " ".join(sorted(set(normalize_query(query).split())))
+    return (run_id, words, max_results, topic, include_raw_content)
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8', errors='ignore')).hexdigest()
+
+def tavily_search_query(
+    query: str,
+    max_results: int = 3,
+    topic: Literal['general', 'finance', 'news', ] = 'general',
+    include_raw_content: bool = True
+) -> dict:
+    """Search a single query with Tavily, sharing the call with identical concurrent searches.
+
+    Args:
+        query: Search query to execute
+        max_results: Maximum number of results
+        topic: Topic filter for search results
+        include_raw_content: Whether to include raw webpage content
+
+    Returns:
+        Search result dictionary
+    """
+    prefetched = find_prefetched_search(query, max_results, topic, include_raw_content)
+    if prefetched is not None:
+        return prefetched
+    key = (normalize_query(query), max_results, topic, include_raw_content)
+    return search_flight.do(key, run_search, query, max_results, topic, include_raw_content)
+
+def run_search(query: str, max_results: int, topic: str, include_raw_content: bool) -> dict:
+    """Call Tavily for one query, see tavily_search_query"""
+    charge_search()
+    request = dict(query=query, max_results=max_results, topic=topic, include_raw_content=include_raw_content)
+    cassette = get_cassette()
+    if cassette is not None:
+        return cassette.call('search', 'tavily', request, lambda: tavily_client.search(**request))
+    return tavily_client.search(**request)
+
+def find_prefetched_search(query: str, max_results: int, topic: str, include_raw_content: bool) -> Optional[dict]:
+    """Result of a search the current run prefetched for a similar query, waiting for it if still in flight.
+
+    Only runs inside use_prefetch_run are served. A prefetch is used for the same
+    query words, or else for the most similar query of at least
+    prefetch_match_threshold, since agents rarely repeat the topic word for word.
+    Each prefetched search is handed out once, so it serves the first matching
+    query and later searches go to Tavily.
+    """
+    run_id = _prefetch_run.get()
+    if run_id is None:
+        return None
+    key = prefetch_key(run_id, query, max_results, topic, include_raw_content)
+    future = prefetched_searches.pop(key)
+    if future is None:
+        candidates = [
+            (query_similarity(key[1], other[1]), other) for other in prefetched_searches.keys()
+            if other[0] == run_id and other[2:] == key[2:]
+        ]
+        for similarity, other in sorted(candidates, reverse=True):
+            if similarity < prefetch_match_threshold:
+                break
+            future = prefetched_searches.pop(other)
+            if future is not None:
+                break
+    if future is None:
+        return None
+    count_prefetch('used')
+    # a failed prefetch resolves to None and the search runs normally
+    return future.result()
+
+def speculative_queries(research_topic: str) -> list[str]:
+    """Derive the likely first search query of a research topic without a model call.
+
+    Agents tend to open with a search for the topic's first sentence, which is
+    cut to a search sized length. Keyword-only queries were dropped, agents
+    almost never searched for them and each cost a search and its summaries.
+    """
+    first_sentence = research_topic.strip().split(". ")[0].split("\n")[0]
+    query = " ".join(first_sentence.split()[:12]).rstrip(".,;:")
+    return [query] if query else []
+
+def prefetch_search(query: str, max_results: int = 3, topic: str = 'general'):
+    """Search and summarize a query speculatively so a research agent asking for it is served at once.
+
+    The search result is kept in prefetched_searches for the tavily_search_query
+    calls of the run set with use_prefetch_run, and its summaries in summary_cache.
+    Outside of such a run nothing is prefetched. Errors are only reported, the
+    agent then searches on its own.
+    """
+    run_id = _prefetch_run.get()
+    if run_id is None:
+        return
+    key = prefetch_key(run_id, query, max_results, topic, True)
+    future = Future()
+    if not prefetched_searches.add(key, future):
+        return
+    count_prefetch('started')
+    try:
+        result = search_flight.do((normalize_query(query), max_results, topic, True), run_search, query, max_results, topic, True)
+        future.set_result(result)
+        process_search_results(deduplicate_search_results([result]), query)
+    except Exception as e:
+        print(f"Speculative search failed for {query!r}: {e}")
+        prefetched_searches.pop(key)
+        count_prefetch('failed')
+        if not future.done():
+            future.set_result(None)
+
 def tavily_search_multiple(
     search_queries : List[str],
     max_results: int = 3,
@@ -41,7 +324,7 @@ def tavily_search_multiple(
 
     search_docs = []
     for query in search_queries:
-        result = tavily_client.search(
+        result = tavily_search_query(
             query=query,
             max_results = max_results,
             topic=topic,
@@ -50,38 +333,198 @@ def tavily_search_multiple(
         search_docs.append(result)
     return search_docs
 
-def summarize_webpage_content(webpage_content: str) -> str:
+class RetrievalBackend(ABC):
+    """Source of search results for the research tools.
+
+    Backends return Tavily's response shape, {'query': ..., 'results': [...]} with
+    'url', 'title', 'content', 'raw_content' and 'score' per result, so their
+    results go through deduplicate_search_results, process_search_results and
+    format_search_output like web searches. Backends without a per-call cost can
+    set llm_summaries to False to have their pages summarized locally only.
+    """
+
+    llm_summaries = True
+
+    @abstractmethod
+    def search(self, query: str, max_results: int = 3, topic: str = 'general', include_raw_content: bool = True) -> dict:
+        ...
+
+class TavilyBackend(RetrievalBackend):
+    """Web search through Tavily, with single-flight, prefetch, budget and cassette handling"""
+
+    def search(self, query: str, max_results: int = 3, topic: str = 'general', include_raw_content: bool = True) -> dict:
+        return tavily_search_query(query, max_results=max_results, topic=topic, include_raw_content=include_raw_content)
+
+class LocalCorpusBackend(RetrievalBackend):
+    """Documents of the local corpus in DEEP_RESEARCH_CORPUS_DIR, re-indexed incrementally before searching"""
+
+    llm_summaries = False
+
+    def search(self, query: str, max_results: int = 3, topic: str = 'general', include_raw_content: bool = True) -> dict:
+        corpus = get_local_corpus()
+        if corpus is None:
+            return {"query": query, "results": []}
+        corpus.refresh()
+        return corpus.search(query, max_results=max_results, include_raw_content=include_raw_content)
+
+retrieval_backends: dict[str, RetrievalBackend] = {
+    'tavily': TavilyBackend(),
+    'local': LocalCorpusBackend(),
+}
+
+def register_retrieval_backend(name: str, backend: RetrievalBackend):
+    """Make a retrieval backend available to search_with_backend under `name`"""
+    retrieval_backends[name] = backend
+
+def search_with_backend(backend: str, query: str, max_results: int = 3, topic: str = 'general') -> str:
+    """Search one query with a registered backend and return the formatted, summarized results.
+
+    Args:
+        backend: Name of the backend in retrieval_backends
+        query: Search query to execute
+        max_results: Maximum number of results
+        topic: Topic filter for backends that support it
+
+    Returns:
+        Formatted string of search results with summaries
+    """
+    if backend not in retrieval_backends:
+        raise ValueError(f"Unknown retrieval backend {backend}, expected one of {list(retrieval_backends)}")
+    retriever = retrieval_backends[backend]
+    search_results = [retriever.search(query, max_results=max_results, topic=topic, include_raw_content=True)]
+    unique_results = deduplicate_search_results(search_results)
+    summarized_results = process_search_results(unique_results, query, llm_summaries=retriever.llm_summaries)
+    return format_search_output(summarized_results)
+
+def summarize_webpage_content(webpage_content: str, query: str = None) -> str:
     """Summarize webpage content using the configured summarization model.
 
+    Concurrent requests for the same content, e.g. sub-agents reaching the same
+    URL, share a single summarization call, and summaries are cached for
+    result_cache_ttl seconds. Falls back to the local extractive
+    summarizer when the model fails, without caching the fallback so the page
+    is summarized by the model again next time.
+
     Args:
         webpage_content: Raw webpage content to summarize
+        query: Search query the page was retrieved for, used by the fallback
 
     Returns:
         Formatted summary with key excerpts
     """
-    try:
-        # Set up structured output model for summarization
-        structured_model = summary_model.with_structured_output(Summary)
-
-        # Generate summary
-        summary = structured_model.invoke([
-            HumanMessage(content=summarize_webpage_prompt.format(
-                webpage_content=webpage_content, 
-                date=get_today_str()
-            ))
-        ])
+    key = content_hash(webpage_content)
+    summary = summary_cache.get(key)
+    if summary is None:
+        try:
+            summary = summary_flight.do(key, generate_webpage_summary, webpage_content)
+        except Exception as e:
+            print(f"Failed to summarize webpage: {str(e)}")
+            return extractive_summary(webpage_content, query)
+        summary_cache.put(key, summary)
+    return summary
+
+def format_summary(summary: Any) -> str:
+    """Summary or PageSummary in the format returned to the research agents"""
+    return (
+        f"<summary>\n{summary.summary}\n</summary>\n\n"
+        f"<key_excerpts>\n{summary.key_excerpts}\n</key_excerpts>"
+    )
 
-        # Format summary with clear structure
-        formatted_summary = (
-            f"<summary>\n{summary.summary}\n</summary>\n\n"
-            f"<key_excerpts>\n{summary.key_excerpts}\n</key_excerpts>"
-        )
+def pack_batches(pages: dict[str, str], max_tokens: int) -> list[dict[str, str]]:
+    """Group pages into batches of about max_tokens, pages larger than that get a batch of their own"""
+    batches, current, current_tokens = [], {}, 0
+    for url, content in pages.items():
+        tokens = estimate_tokens(content)
+        if current and current_tokens + tokens > max_tokens:
+            batches.append(current)
+            current, current_tokens = {}, 0
+        current[url] = content
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def summarize_webpages(pages: dict[str, str], query: str = None) -> dict[str, str]:
+    """Summarize several webpages with as few summarization calls as possible.
+
+    Cached summaries are reused, the other pages are packed into batches of
+    max_batch_summary_tokens that are summarized in one structured call each.
+    Concurrent requests for the same batch share a single call. Pages the model
+    skipped and batches of a single page go through summarize_webpage_content
+    one by one.
 
-        return formatted_summary
+    Args:
+        pages: Raw webpage content by URL
+        query: Search query the pages were retrieved for, used by the fallback
 
+    Returns:
+        Formatted summary with key excerpts by URL
+    """
+    summaries = {}
+    remaining = {}
+    for url, content in pages.items():
+        cached = summary_cache.get(content_hash(content))
+        if cached is not None:
+            summaries[url] = cached
+        else:
+            remaining[url] = content
+
+    for batch in pack_batches(remaining, max_batch_summary_tokens):
+        if len(batch) > 1:
+            key = ('batch',) + tuple(sorted((url, content_hash(content)) for url, content in batch.items()))
+            for url, summary in summary_flight.do(key, generate_batch_summary, batch).items():
+                summaries[url] = summary
+                summary_cache.put(content_hash(batch[url]), summary)
+        for url, content in batch.items():
+            if url not in summaries:
+                summaries[url] = summarize_webpage_content(content, query)
+    return summaries
+
+def generate_batch_summary(batch: dict[str, str]) -> dict[str, str]:
+    """Run the summarization model once on several pages, returns the summaries it produced by URL"""
+    webpages = "\n\n".join(
+        f"<webpage url=\"{url}\">\n{content}\n</webpage>" for url, content in batch.items()
+    )
+    try:
+        structured_model = summary_model.with_structured_output(BatchSummary)
+        result = structured_model.invoke([
+            HumanMessage(content=summarize_webpages_batch_prompt.format(webpages=webpages, date=get_today_str()))
+        ])
     except Exception as e:
-        print(f"Failed to summarize webpage: {str(e)}")
-        return webpage_content[:1000] + "..." if len(webpage_content) > 1000 else webpage_content
+        print(f"Failed to summarize {len(batch)} webpages in one call: {str(e)}")
+        return {}
+
+    summaries = {}
+    for page in result.summaries:
+        url = page.url.strip()
+        if url in batch and page.summary.strip():
+            summaries[url] = format_summary(page)
+    missing = len(batch) - len(summaries)
+    if missing:
+        print(f"Batched summarization skipped {missing} of {len(batch)} webpages, summarizing them one by one")
+    return summaries
+
+def generate_webpage_summary(webpage_content: str) -> str:
+    """Run the summarization model on webpage content, see summarize_webpage_content.
+
+    Raises the model's error or ValueError for an empty summary, callers fall
+    back to a local summary.
+    """
+    # Set up structured output model for summarization
+    structured_model = summary_model.with_structured_output(Summary)
+
+    # Generate summary
+    summary = structured_model.invoke([
+        HumanMessage(content=summarize_webpage_prompt.format(
+            webpage_content=webpage_content, 
+            date=get_today_str()
+        ))
+    ])
+    if not summary.summary.strip():
+        raise ValueError("Model returned an empty summary")
+
+    # Format summary with clear structure
+    return format_summary(summary)
 
 def deduplicate_search_results(search_results: List[dict]) -> dict:
     """Deduplicate search results by URL to avoid processing duplicate content.
@@ -102,37 +545,109 @@ def deduplicate_search_results(search_results: List[dict]) -> dict:
 
     return unique_results
 
-def process_search_results(unique_results: dict) -> dict:
+def process_search_results(unique_results: dict, query: str = None, llm_summaries: bool = True) -> dict:
     """Process search results by summarizing content where available.
 
+    Results are ranked by Tavily's score combined with a local BM25 score. Only
+    the summarize_top_k best results scoring at least min_relevance_score are
+    summarized, the rest keep their short search snippet. Of the summarized
+    pages, the llm_summary_top_k best with at least min_llm_summary_chars of
+    content go to the summarization model and the others to the local
+    extractive summarizer. With batch_summaries set, the model pages share
+    summarization calls and are instead chosen by rank until they fill one
+    batch of max_batch_summary_tokens.
+
     Args:
         unique_results: Dictionary of unique search results
+        query: Search query the results were retrieved for
+        llm_summaries: Whether pages may go to the summarization model at all
 
     Returns:
-        Dictionary of processed results with summaries
+        Dictionary of processed results with summaries, most relevant first
     """
     summarized_results = {}
-
-    for url, result in unique_results.items():
-        # Use existing content if no raw content for summarization
-        if not result.get("raw_content"):
+    # low on run budget, pass the search snippets on instead of summarizing
+    skip_summarization = budget_level() >= SKIP_SUMMARIZATION
+
+    ranked = rank_search_results(unique_results, query)
+    relevant_urls = [
+        url for url, score in ranked
+        if score >= min_relevance_score and unique_results[url].get("raw_content")
+    ]
+    summarize_urls = relevant_urls if summarize_top_k is None else relevant_urls[:summarize_top_k]
+    long_urls = [url for url in relevant_urls if len(unique_results[url]['raw_content']) >= min_llm_summary_chars]
+
+    batch_mode = batch_summaries and llm_summaries and not skip_summarization
+    if batch_mode:
+        # a batched call costs per token rather than per page, fill one batch with the best long pages
+        llm_urls, batch_tokens = set(), 0
+        for url in long_urls:
+            tokens = estimate_tokens(unique_results[url]['raw_content'])
+            if llm_urls and batch_tokens + tokens > max_batch_summary_tokens:
+                break
+            llm_urls.add(url)
+            batch_tokens += tokens
+        summarize_urls = summarize_urls + [url for url in relevant_urls if url in llm_urls and url not in summarize_urls]
+    else:
+        llm_urls = set([url for url in long_urls if url in summarize_urls][:llm_summary_top_k] if llm_summaries else [])
+
+    # the model summaries of one search share calls in batched mode
+    batched = {}
+    if batch_mode and len(llm_urls) > 1:
+        batched = summarize_webpages({url: unique_results[url]['raw_content'] for url in summarize_urls if url in llm_urls}, query)
+
+    for url, score in ranked:
+        result = unique_results[url]
+        # Use existing content for pages without raw content or not relevant enough to summarize
+        if skip_summarization or url not in summarize_urls:
             content = result['content']
-        else:
+        elif url in batched:
+            content = batched[url]
+        elif url in llm_urls:
             # Summarize raw content for better processing
-            content = summarize_webpage_content(result['raw_content'])
+            content = summarize_webpage_content(result['raw_content'], query)
+        else:
+            content = extractive_summary(result['raw_content'], query)
 
         summarized_results[url] = {
             'title': result['title'],
-            'content': content
+            'content': content,
+            'score': score
         }
 
+    # make everything fetched searchable for the other sub-agents of the run
+    notes_index = get_notes_index()
+    if notes_index is not None:
+        notes_index.add_search_results(unique_results, summarized_results)
+
     return summarized_results
 
-def format_search_output(summarized_results: dict) -> str:
+# Marker appended to trimmed summaries
+trim_suffix = " ... [trimmed]"
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens on a word boundary, marking that it was trimmed.
+
+    The marker counts towards max_tokens, so the result never estimates above it.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max(max_tokens - estimate_tokens(trim_suffix), 0) * 4].rsplit(" ", 1)[0]
+    return cut + trim_suffix
+
+def format_search_output(summarized_results: dict, max_tokens: int = None) -> str:
     """Format search results into a well-structured string output.
 
+    Sources are ordered by relevance and packed into a token budget, since the
+    output is re-sent with every later model call of the agent. When the budget
+    is exceeded the summaries of the lower ranked sources are trimmed first,
+    from the lowest ranked upward, then those sources are left out from the
+    bottom and listed as omitted. The best source is only trimmed when it does
+    not fit on its own.
+
     Args:
         summarized_results: Dictionary of processed search results
+        max_tokens: Approximate token budget, defaults to max_search_output_tokens
 
     Returns:
         Formatted string of search results with clear source separation
@@ -140,15 +655,65 @@ def format_search_output(summarized_results: dict) -> str:
     if not summarized_results:
         return "No valid search results found. Please try different search queries or use a different search API."
 
-    formatted_output = "Search results: \n\n"
+    max_tokens = max_search_output_tokens if max_tokens is None else max_tokens
+    ranked = sorted(summarized_results.items(), key=lambda item: item[1].get('score') or 0, reverse=True)
+    header = "Search results: \n\n"
+    separator = "-" * 80 + "\n"
 
-    for i, (url, result) in enumerate(summarized_results.items(), 1):
-        formatted_output += f"\n\n--- SOURCE {i}: {result['title']} ---\n"
-        formatted_output += f"URL: {url}\n\n"
-        formatted_output += f"SUMMARY:\n{result['content']}\n\n"
-        formatted_output += "-" * 80 + "\n"
+    def source_heading(i, url, result):
+        return f"\n\n--- SOURCE {i}: {result['title']} ---\nURL: {url}\n\nSUMMARY:\n"
 
-    return formatted_output
+    def omitted_note(omitted):
+        return (
+            f"\n[{len(omitted)} lower ranked source(s) omitted to fit the output budget: "
+            + ", ".join(url for url, _ in omitted) + "]\n"
+        )
+
+    contents = [str(result['content']) for _, result in ranked]
+    costs = [
+        estimate_tokens(source_heading(i, url, result) + separator) + estimate_tokens(content)
+        for i, ((url, result), content) in enumerate(zip(ranked, contents), 1)
+    ]
+    over = estimate_tokens(header) + sum(costs) - max_tokens
+
+    def trim(i, max_content_tokens):
+        nonlocal over
+        content_tokens = estimate_tokens(contents[i])
+        contents[i] = trim_to_tokens(contents[i], max_content_tokens)
+        saved = content_tokens - estimate_tokens(contents[i])
+        costs[i] -= saved
+        over -= saved
+
+    # trim the summaries of the lower ranked sources first, from the lowest ranked upward
+    for i in reversed(range(1, len(ranked))):
+        if over <= 0:
+            break
+        content_tokens = estimate_tokens(contents[i])
+        if content_tokens - min_source_tokens > 0:
+            trim(i, max(content_tokens - over, min_source_tokens))
+
+    # still over budget, leave out whole sources from the bottom, always keeping the best one
+    kept = len(ranked)
+    while over > 0 and kept > 1:
+        kept -= 1
+        # the note listing the omitted sources counts towards the budget as well
+        over = estimate_tokens(header) + sum(costs[:kept]) + estimate_tokens(omitted_note(ranked[kept:])) - max_tokens
+
+    # the best source alone does not fit, trim it to what is left
+    if over > 0:
+        trim(0, max(estimate_tokens(contents[0]) - over, 0))
+
+    parts = [header]
+    for i, ((url, result), content) in enumerate(zip(ranked[:kept], contents), 1):
+        parts.append(source_heading(i, url, result))
+        parts.append(f"{content}\n\n")
+        parts.append(separator)
+
+    omitted = ranked[kept:]
+    if omitted:
+        parts.append(omitted_note(omitted))
+
+    return "".join(parts)
 
 # ===== RESEARCH TOOLS =====
 
@@ -168,19 +733,55 @@ def tavily_search(
     Returns:
         Formatted string of search results with summaries
     """
-    # Execute search for single query
-    search_results = tavily_search_multiple(
-        [query],  # Convert single query to list for the internal function
-        max_results=max_results,
-        topic=topic,
-        include_raw_content=True,
-    )
+    return search_with_backend('tavily', query, max_results=max_results, topic=topic)
 
-    # Deduplicate results by URL to avoid processing duplicate content
-    unique_results = deduplicate_search_results(search_results)
+@tool(parse_docstring=True)
+def local_search(
+    query: str,
+    max_results: Annotated[int, InjectedToolArg] = 5,
+) -> str:
+    """Search the local document collection, returns in milliseconds at no cost.
 
-    # Process results with summarization
-    summarized_results = process_search_results(unique_results)
+    Use it before tavily_search for topics the local documents may cover.
 
-    # Format output for consumption
-    return format_search_output(summarized_results)
+    Args:
+        query: A single search query to execute
+        max_results: Maximum number of documents to return
+
+    Returns:
+        Formatted string of matching documents with summaries
+    """
+    return search_with_backend('local', query, max_results=max_results)
+
+@tool(parse_docstring=True)
+def search_notes(
+    query: str,
+    max_results: Annotated[int, InjectedToolArg] = 5,
+) -> str:
+    """Search the pages and summaries already retrieved by all researchers of this run.
+
+    The lookup is local and returns in milliseconds, so use it before tavily_search
+    to check whether another researcher already found the information.
+
+    Args:
+        query: Keywords to look up in the retrieved notes
+        max_results: Maximum number of passages to return
+
+    Returns:
+        Formatted string of matching passages with their sources
+    """
+    notes_index = get_notes_index()
+    if notes_index is None or not len(notes_index):
+        return "No notes have been retrieved in this run yet. Use tavily_search instead."
+
+    matches = notes_index.search(query, max_results=max_results)
+    if not matches:
+        return f"No retrieved notes match \"{query}\". Use tavily_search to search the web."
+
+    parts = [f"Notes matching \"{query}\":\n"]
+    for i, (document, score) in enumerate(matches, 1):
+        parts.append(
+            f"\n--- NOTE {i} ({document['kind']}): {document['title']} ---\n"
+            f"URL: {document['url']}\n\n{document['text']}\n"
+        )
+    return "".join(parts)
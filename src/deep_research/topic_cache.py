@@ -0,0 +1,149 @@
+"""
+Persistent cache of sub-agent research results across runs.
+
+Research topics are keyed by a fingerprint of their normalized word set, so small
+wording differences still hit, and near matches above a similarity threshold are
+served as well as long as their numbers (years, versions, quantities) are the same. Entries expire after a freshness TTL. The supervisor only uses the
+cache for runs started with `use_topic_cache` set in their state.
+"""
+
+from deep_research.utils import normalize_query, STOPWORDS
+from typing_extensions import Optional
+from os import getenv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Location of the cache database, override with DEEP_RESEARCH_CACHE_PATH
+cache_path = getenv(
+    'DEEP_RESEARCH_CACHE_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'deep_research', 'topic_cache.sqlite')
+)
+
+# Seconds a cached result stays fresh
+topic_cache_ttl = 7 * 24 * 3600
+
+# Minimum word set similarity for a cached topic to count as a match, words with digits must match exactly
+topic_similarity_threshold = 0.85
+
+
+def topic_words(topic: str) -> list[str]:
+    """Sorted distinct words of a topic without stopwords, single characters such as versions are kept"""
+    return sorted(set(word for word in normalize_query(topic).split() if word not in STOPWORDS))
+
+
+def numeric_words(words: set[str]) -> set[str]:
+    """Words containing a digit, a topic about 2023 is not a near match of the same topic about 2024"""
+    return set(word for word in words if any(char.isdigit() for char in word))
+
+
+def topic_fingerprint(topic: str) -> str:
+    """Stable key for a topic which ignores case, punctuation, stopwords and word order"""
+    return hashlib.sha256(" ".join(topic_words(topic)).encode('utf-8')).hexdigest()
+
+
+class TopicCache:
+    """SQLite backed cache of compressed_research and raw_notes keyed by research topic"""
+
+    def __init__(
+        self,
+        path: str = None,
+        ttl: float = None,
+        similarity_threshold: float = None,
+    ):
+        self.path = path or cache_path
+        self.ttl = topic_cache_ttl if ttl is None else ttl
+        self.similarity_threshold = topic_similarity_threshold if similarity_threshold is None else similarity_threshold
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS topics (
+                    fingerprint TEXT PRIMARY KEY,
+                    topic TEXT NOT NULL,
+                    words TEXT NOT NULL,
+                    compressed_research TEXT NOT NULL,
+                    raw_notes TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._connection.execute("CREATE INDEX IF NOT EXISTS topics_created_at ON topics (created_at)")
+
+    def get(self, topic: str) -> Optional[dict]:
+        """Return the fresh cached result for topic, or for the most similar fresh topic, None on a miss"""
+        words = topic_words(topic)
+        if not words:
+            return None
+        oldest = time.time() - self.ttl
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT topic, compressed_research, raw_notes, created_at FROM topics WHERE fingerprint = ? AND created_at >= ?",
+                (topic_fingerprint(topic), oldest)
+            ).fetchone()
+            if row is None:
+                row = self._most_similar(set(words), oldest)
+        if row is None:
+            return None
+        cached_topic, compressed_research, raw_notes, created_at = row
+        return {
+            "research_topic": cached_topic,
+            "compressed_research": compressed_research,
+            "raw_notes": json.loads(raw_notes),
+            "cached_at": created_at,
+        }
+
+    def _most_similar(self, words: set[str], oldest: float) -> Optional[tuple]:
+        best, best_similarity = None, self.similarity_threshold
+        numbers = numeric_words(words)
+        for fingerprint, stored_words in self._connection.execute(
+            "SELECT fingerprint, words FROM topics WHERE created_at >= ?", (oldest,)
+        ):
+            stored = set(stored_words.split())
+            if numeric_words(stored) != numbers:
+                continue
+            similarity = len(words & stored) / len(words | stored)
+            if similarity >= best_similarity:
+                best, best_similarity = fingerprint, similarity
+        if best is None:
+            return None
+        return self._connection.execute(
+            "SELECT topic, compressed_research, raw_notes, created_at FROM topics WHERE fingerprint = ?", (best,)
+        ).fetchone()
+
+    def put(self, topic: str, result: dict):
+        """Store the compressed_research and raw_notes of a finished research agent"""
+        words = topic_words(topic)
+        if not words or not result.get("compressed_research"):
+            return
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO topics VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    topic_fingerprint(topic), topic, " ".join(words), result["compressed_research"],
+                    json.dumps(list(result.get("raw_notes", []))), time.time()
+                )
+            )
+
+    def prune(self) -> int:
+        """Delete expired entries, returns how many were removed"""
+        with self._lock, self._connection:
+            cursor = self._connection.execute("DELETE FROM topics WHERE created_at < ?", (time.time() - self.ttl,))
+            return cursor.rowcount
+
+
+_topic_cache: Optional[TopicCache] = None
+_topic_cache_lock = threading.Lock()
+
+
+def get_topic_cache() -> TopicCache:
+    """Shared cache instance, the database is only opened on first use"""
+    global _topic_cache
+    with _topic_cache_lock:
+        if _topic_cache is None:
+            _topic_cache = TopicCache()
+        return _topic_cache
@@ -1,5 +1,6 @@
 from typing import Any
 from datetime import datetime
+import re
 
 def get_today_str():
     """return todays date in windows, different method for other os"""
@@ -13,4 +14,34 @@ def format_tool_instructions(tools: list[Any]) -> str:
         tool_str += f"<tool_name> {tool.name} <tool_name>\n"   # Use .name
         tool_str += f"<tool_description>{tool.description}<tool_description>\n"
         tool_str += "<tool_info>\n"
-    return tool_str
\ No newline at end of file
+    return tool_str
+
+def normalize_query(query: str) -> str:
+    """Lowercase a query, drop punctuation and collapse whitespace so equivalent queries compare equal"""
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers herself him himself his how i if in into is it its itself just me more most
+my myself no nor not now of off on once only or other our ours ourselves out over own same she
+should so some such than that the their theirs them themselves then there these they this those
+through to too under until up very was we were what when where which while who whom why will with
+would you your yours yourself yourselves
+""".split())
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase word tokens without stopwords, used for local text scoring"""
+    return [word for word in re.findall(r"\w+", text.lower()) if word not in STOPWORDS and len(word) > 1]
+
+def query_similarity(first: str, second: str) -> float:
+    """Jaccard similarity of the word sets of two queries, 1.0 for identical word sets"""
+    first_words = set(normalize_query(first).split())
+    second_words = set(normalize_query(second).split())
+    if not first_words or not second_words:
+        return float(first_words == second_words)
+    return len(first_words & second_words) / len(first_words | second_words)
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token count estimate of about four characters per token"""
+    return (len(text) + 3) // 4
@@ -0,0 +1,260 @@
+"""
+Worker backends that run research sub-agents outside of the supervisor's process.
+
+supervisor_tools runs sub-agents as coroutines in its own process by default. With
+`research_backend` set to 'process' they are dispatched to a local process pool,
+with 'sqlite' they are put on an SQLite job queue consumed by worker processes
+started with:
+
+    python -m deep_research.workers --queue /path/to/jobs.sqlite --processes 8
+
+Jobs are keyed by the run id and the ConductResearch tool call id, and results come
+back under the same key. The run budget and the run's notes index live in the
+supervisor's process and are not shared with remote workers.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing_extensions import Optional
+from os import getenv
+import multiprocessing
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+# SQLite job queue shared by the supervisor and its workers
+job_queue_path = getenv(
+    'DEEP_RESEARCH_JOB_QUEUE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'deep_research', 'jobs.sqlite')
+)
+
+# Seconds between polls of the job queue
+queue_poll_interval = 0.5
+
+# Extra seconds the supervisor waits on a remote job beyond the sub-agent deadline,
+# the worker enforces the deadline itself and returns partial results
+remote_grace_seconds = 30
+
+
+def run_research_job(research_topic: str, timeout: float) -> dict:
+    """Run one research sub-agent to completion in the current process.
+
+    This is the entry point of pool and queue workers, the graph modules are
+    imported on first use and stay warm for the following jobs.
+    """
+    from deep_research.research_supervisor import run_research_agent
+
+    result = asyncio.run(run_research_agent(research_topic, timeout))
+    return {
+        "compressed_research": result.get("compressed_research", ""),
+        "raw_notes": list(result.get("raw_notes", [])),
+        "partial": bool(result.get("partial", False)),
+    }
+
+
+class ProcessPoolBackend:
+    """Runs sub-agents on a pool of local worker processes"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn instead of fork, the supervisor process has running threads and event loops
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    async def run(self, job_id: str, research_topic: str, timeout: float) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, run_research_job, research_topic, timeout)
+        return await asyncio.wait_for(future, timeout + remote_grace_seconds)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+class SQLiteJobQueue:
+    """Research jobs in an SQLite table, shared between the supervisor and worker processes"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or job_queue_path
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    research_topic TEXT NOT NULL,
+                    timeout REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    result TEXT,
+                    error TEXT,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def submit(self, job_id: str, research_topic: str, timeout: float):
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, research_topic, timeout, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, research_topic, timeout, now, now)
+            )
+
+    def claim(self, worker: str) -> Optional[tuple[str, str, float]]:
+        """Atomically take the oldest queued job, returns (job_id, research_topic, timeout)"""
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT job_id, research_topic, timeout FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, updated_at = ? WHERE job_id = ?",
+                        (worker, time.time(), row[0])
+                    )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            return row
+
+    def finish(self, job_id: str, result: Optional[dict] = None, error: Optional[str] = None):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE job_id = ? AND status = 'running'",
+                ('failed' if error else 'done', json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+
+    def cancel(self, job_id: str):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE job_id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id)
+            )
+
+    def poll(self, job_id: str) -> Optional[dict]:
+        """Result of a finished job, None while it is queued or running. Raises RuntimeError for failed jobs"""
+        with self._connect() as connection:
+            row = connection.execute("SELECT status, result, error FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None or row[0] in ('queued', 'running'):
+            return None
+        status, result, error = row
+        if status != 'done':
+            raise RuntimeError(f"Research job {job_id} {status}: {error or 'no result'}")
+        return json.loads(result)
+
+
+class SQLiteQueueBackend:
+    """Puts sub-agents on an SQLite job queue and waits for worker processes to return them"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.queue = SQLiteJobQueue(path)
+
+    async def run(self, job_id: str, research_topic: str, timeout: float) -> dict:
+        await asyncio.to_thread(self.queue.submit, job_id, research_topic, timeout)
+        deadline = time.monotonic() + timeout + remote_grace_seconds
+        try:
+            while True:
+                result = await asyncio.to_thread(self.queue.poll, job_id)
+                if result is not None:
+                    return result
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"No worker finished research job {job_id} in time")
+                await asyncio.sleep(queue_poll_interval)
+        except BaseException:
+            # includes cancellation of the supervisor, so the job is not left for a worker
+            await asyncio.shield(asyncio.to_thread(self.queue.cancel, job_id))
+            raise
+
+
+_backends: dict[str, object] = {}
+_backends_lock = threading.Lock()
+
+
+def get_research_backend(name: str):
+    """Shared backend instance for 'process' or 'sqlite'"""
+    with _backends_lock:
+        if name not in _backends:
+            if name == 'process':
+                _backends[name] = ProcessPoolBackend()
+            elif name == 'sqlite':
+                _backends[name] = SQLiteQueueBackend()
+            else:
+                raise ValueError(f"Unknown research backend {name}, expected 'inprocess', 'process' or 'sqlite'")
+        return _backends[name]
+
+
+def worker_loop(path: Optional[str] = None, poll_interval: float = None):
+    """Consume research jobs from the SQLite queue until interrupted"""
+    queue = SQLiteJobQueue(path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    poll_interval = queue_poll_interval if poll_interval is None else poll_interval
+    print(f"Research worker {worker} consuming {queue.path}")
+    while True:
+        job = queue.claim(worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        job_id, research_topic, timeout = job
+        try:
+            queue.finish(job_id, result=run_research_job(research_topic, timeout))
+        except Exception as e:
+            print(f"Research job {job_id} failed: {e}")
+            queue.finish(job_id, error=f"{type(e).__name__}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run research sub-agent workers consuming an SQLite job queue")
+    parser.add_argument("--queue", default=job_queue_path, help="Path of the SQLite job queue")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes to start")
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        worker_loop(args.queue)
+        return
+
+    processes = [
+        multiprocessing.get_context('spawn').Process(target=worker_loop, args=(args.queue,), daemon=True)
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
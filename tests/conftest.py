@@ -0,0 +1,12 @@
+"""
+Shared setup of the offline tests.
+
+The modules create their OpenRouter chat models and Tavily client at import
+time, so placeholder keys are set before anything is imported. No test sends a
+request to either service, model calls are answered by fakes or cassettes.
+"""
+
+import os
+
+os.environ.setdefault('OPENROUTER_API_KEY', 'test-key')
+os.environ.setdefault('TAVILY_API_KEY', 'test-key')
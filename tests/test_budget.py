@@ -0,0 +1,61 @@
+from deep_research import research_agent, tavily
+from deep_research.budget import (
+    RunBudget, use_run_budget, budget_level, count_tokens, budget_callback,
+    BUDGET_OK, REDUCE_PARALLELISM, SKIP_SUMMARIZATION, FORCE_COMPLETE,
+)
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import LLMResult
+import pytest
+
+
+@pytest.mark.parametrize("used, level", [
+    (0, BUDGET_OK),
+    (49, BUDGET_OK),
+    (50, REDUCE_PARALLELISM),
+    (75, SKIP_SUMMARIZATION),
+    (90, FORCE_COMPLETE),
+    (150, FORCE_COMPLETE),
+])
+def test_levels_follow_the_remaining_budget(used, level):
+    budget = RunBudget(max_tokens=100)
+    budget.charge_tokens(used)
+    assert budget.level() == level
+
+
+def test_tightest_limit_decides_the_level():
+    budget = RunBudget(max_tokens=1000, max_search_calls=4)
+    budget.charge_tokens(100)
+    budget.charge_search(3)
+    assert budget.remaining_fraction() == pytest.approx(0.25)
+    assert budget.level() == SKIP_SUMMARIZATION
+
+
+def test_unbounded_run_never_degrades():
+    assert budget_level() == BUDGET_OK
+    budget = RunBudget()
+    budget.charge_tokens(10 ** 9)
+    assert budget.level() == BUDGET_OK
+
+
+def test_callback_charges_reported_tokens():
+    budget = RunBudget(max_tokens=1000)
+    response = LLMResult(generations=[], llm_output={"token_usage": {"total_tokens": 300}})
+    with use_run_budget(budget), count_tokens() as counter:
+        budget_callback.on_llm_end(response)
+    budget_callback.on_llm_end(response)
+    assert budget.tokens_used == 300
+    assert counter == [300]
+
+
+def test_exhausted_budget_forces_compression_and_skips_summaries():
+    budget = RunBudget(max_search_calls=10)
+    budget.charge_search(10)
+    message = AIMessage(content="", tool_calls=[{"name": "tavily_search", "args": {"query": "coffee"}, "id": "1"}])
+    results = {"https://example.com": {"title": "Coffee", "content": "snippet", "raw_content": "coffee " * 1000, "score": 0.9}}
+
+    with use_run_budget(budget):
+        assert research_agent.should_continue({"researcher_messages": [message]}) == "compress_research"
+        processed = tavily.process_search_results(results, "coffee")
+
+    assert processed["https://example.com"]["content"] == "snippet"
+    assert research_agent.should_continue({"researcher_messages": [message]}) == "tool_node"
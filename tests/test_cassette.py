@@ -0,0 +1,99 @@
+from deep_research import research_supervisor
+from deep_research.budget import RunBudget, use_run_budget, budget_callback
+from deep_research.cassette import use_cassette, RECORD, REPLAY, CassetteMiss, ReplayedError
+from deep_research.loadtest import ProviderProfile, SimulatedProvider, SimulatedChatModel, simulated_providers
+from deep_research.openrouter import ModelChain
+from deep_research.research_state import Summary
+from langchain_core.messages import HumanMessage
+from langchain_core.outputs import LLMResult
+import asyncio
+import pytest
+
+
+def simulated_provider() -> SimulatedProvider:
+    return SimulatedProvider(ProviderProfile(
+        time_scale=0.0005, model_rps_limit=None, error_rate=0.0,
+        topics_per_round=2, supervisor_rounds=1, searches_per_researcher=1, page_chars=1500,
+    ))
+
+
+def run_supervisor() -> dict:
+    brief = "Research brief: battery storage cost trends and grid adoption"
+    return asyncio.run(research_supervisor.supervisor_agent.ainvoke({
+        "supervisor_messages": [HumanMessage(content=brief)],
+        "research_brief": brief,
+    }))
+
+
+def test_supervisor_run_replays_without_providers(tmp_path):
+    path = str(tmp_path / "run.jsonl.gz")
+    recording = simulated_provider()
+    with simulated_providers(recording), use_cassette(path, RECORD):
+        recorded = run_supervisor()
+    assert recording.calls["search"] > 0
+
+    # replayed through a provider which must not be called
+    replaying = simulated_provider()
+    with simulated_providers(replaying), use_cassette(path, REPLAY, latency_scale=0) as cassette:
+        replayed = run_supervisor()
+
+    assert recorded["notes"]
+    assert replayed["notes"] == recorded["notes"]
+    assert replayed["raw_notes"] == recorded["raw_notes"]
+    assert sum(replaying.calls.values()) == 0
+    assert cassette.unused() == 0
+
+
+class TokenReportingModel(SimulatedChatModel):
+    """Simulated model which reports its token usage like a chat model callback would"""
+
+    tokens = 120
+
+    def invoke(self, input, config=None, schema=None, include_raw=False, **kwargs):
+        result = super().invoke(input, config, schema, include_raw, **kwargs)
+        budget_callback.on_llm_end(LLMResult(generations=[], llm_output={"token_usage": {"total_tokens": self.tokens}}))
+        return result
+
+
+def make_chain(provider: SimulatedProvider) -> ModelChain:
+    chain = ModelChain('summarizer', ['model-0'])
+    chain.models = [TokenReportingModel(provider, 'model-0', 'summarizer')]
+    return chain
+
+
+def test_replay_charges_recorded_tokens(tmp_path):
+    path = str(tmp_path / "tokens.jsonl.gz")
+    messages = [HumanMessage(content="Summarize this page")]
+
+    recorded_budget = RunBudget(max_tokens=1000)
+    with use_cassette(path, RECORD), use_run_budget(recorded_budget):
+        recorded = make_chain(simulated_provider()).with_structured_output(Summary).invoke(messages)
+        make_chain(simulated_provider()).invoke(messages)
+
+    replaying = simulated_provider()
+    replayed_budget = RunBudget(max_tokens=1000)
+    with use_cassette(path, REPLAY, latency_scale=0), use_run_budget(replayed_budget):
+        replayed = make_chain(replaying).with_structured_output(Summary).invoke(messages)
+        make_chain(replaying).invoke(messages)
+
+    assert recorded_budget.tokens_used == 2 * TokenReportingModel.tokens
+    assert replayed_budget.tokens_used == recorded_budget.tokens_used
+    assert replayed == recorded
+    assert sum(replaying.calls.values()) == 0
+
+
+def test_replay_reproduces_errors_and_reports_misses(tmp_path):
+    path = str(tmp_path / "errors.jsonl.gz")
+    failing = SimulatedProvider(ProviderProfile(model_rps_limit=None, error_rate=1.0, time_scale=0.001))
+    chain = ModelChain('summarizer', ['model-0'])
+    chain.models = [SimulatedChatModel(failing, 'model-0', 'summarizer')]
+    messages = [HumanMessage(content="Summarize this page")]
+
+    with use_cassette(path, RECORD), pytest.raises(Exception):
+        chain.invoke(messages)
+
+    with use_cassette(path, REPLAY, latency_scale=0):
+        with pytest.raises(ReplayedError, match="RateLimitError"):
+            chain.invoke(messages)
+        with pytest.raises(CassetteMiss):
+            chain.invoke(messages)
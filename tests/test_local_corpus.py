@@ -0,0 +1,51 @@
+from deep_research.local_corpus import LocalCorpus
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+
+def write(path, text):
+    with open(path, "w") as file:
+        file.write(text)
+
+
+def make_corpus(tmp_path) -> LocalCorpus:
+    write(tmp_path / "coffee.md", "# Coffee prices\n\nArabica coffee prices rose in 2024 after poor harvests in Brazil.")
+    write(tmp_path / "tea.txt", "Tea exports from Kenya grew steadily.")
+    return LocalCorpus(str(tmp_path), ":memory:")
+
+
+def test_incremental_index(tmp_path):
+    corpus = make_corpus(tmp_path)
+    assert corpus.index() == {"added": 2, "updated": 0, "removed": 0, "unchanged": 0}
+    assert corpus.search("arabica harvest")["results"][0]["title"] == "Coffee prices"
+
+    os.remove(tmp_path / "tea.txt")
+    write(tmp_path / "cocoa.html", "<html><title>Cocoa</title><body><p>Cocoa futures doubled.</p></body></html>")
+    assert corpus.index() == {"added": 1, "updated": 0, "removed": 1, "unchanged": 1}
+    assert corpus.search("cocoa futures")["results"][0]["title"] == "Cocoa"
+    assert corpus.search("kenya tea")["results"] == []
+
+
+def test_concurrent_refresh_indexes_once(tmp_path):
+    corpus = make_corpus(tmp_path)
+    passes = []
+    index = corpus._index
+
+    def slow_index():
+        passes.append(threading.get_ident())
+        time.sleep(0.1)
+        return index()
+    corpus._index = slow_index
+
+    def search(_):
+        corpus.refresh()
+        return corpus.search("coffee prices")["results"]
+
+    with ThreadPoolExecutor(8) as pool:
+        found = list(pool.map(search, range(8)))
+
+    assert len(passes) == 1
+    # callers arriving during the first pass waited for it instead of searching an empty index
+    assert all(results for results in found)
@@ -0,0 +1,117 @@
+from deep_research.loadtest import ProviderProfile, SimulatedProvider, SimulatedChatModel
+from deep_research.openrouter import ModelChain, HEDGE_BURST
+from deep_research.research_state import Summary
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+import asyncio
+import openai
+import pytest
+import time
+
+
+def provider(median: float = 0.001, error_rate: float = 0.0) -> SimulatedProvider:
+    """Provider answering every role after about `median` seconds, failing `error_rate` of the calls with a 429"""
+    latencies = {role: (median, 0.0) for role in ('supervisor', 'researcher', 'compressor', 'summarizer', 'scoper')}
+    return SimulatedProvider(ProviderProfile(latencies=latencies, model_rps_limit=None, error_rate=error_rate))
+
+
+def make_chain(*providers: SimulatedProvider, role: str = 'summarizer', **kwargs) -> ModelChain:
+    names = [f"model-{i}" for i in range(len(providers))]
+    chain = ModelChain(role, names, **kwargs)
+    chain.models = [SimulatedChatModel(p, name, role) for p, name in zip(providers, names)]
+    return chain
+
+
+MESSAGES = [HumanMessage(content="Summarize this page")]
+
+
+def test_falls_back_and_skips_the_failed_model():
+    failing, healthy = provider(error_rate=1.0), provider()
+    chain = make_chain(failing, healthy)
+
+    assert isinstance(chain.invoke(MESSAGES), AIMessage)
+    assert chain.healthy_model == "model-1"
+    chain.invoke(MESSAGES)
+
+    # the failed model cools down, the second call goes straight to the healthy one
+    assert failing.calls["summarizer"] == 1
+    assert healthy.calls["summarizer"] == 2
+
+
+def test_async_fallback():
+    failing, healthy = provider(error_rate=1.0), provider()
+    chain = make_chain(failing, healthy)
+
+    result = asyncio.run(chain.with_structured_output(Summary).ainvoke(MESSAGES))
+
+    assert isinstance(result, Summary)
+    assert (failing.calls["summarizer"], healthy.calls["summarizer"]) == (1, 1)
+
+
+def test_raises_the_last_error_when_every_model_fails():
+    chain = make_chain(provider(error_rate=1.0), provider(error_rate=1.0))
+    with pytest.raises(openai.RateLimitError):
+        chain.invoke(MESSAGES)
+
+
+class OffSchemaModel(SimulatedChatModel):
+    """Model whose structured replies can not be repaired into the schema"""
+
+    def with_structured_output(self, schema, include_raw=False, **kwargs):
+        def reply(input):
+            self.provider.admit(self.name, self.role)
+            return {"raw": AIMessage(content='{"answer": "wrong shape"}'), "parsed": None, "parsing_error": ValueError("no match")}
+        return RunnableLambda(reply)
+
+
+def test_unrepairable_output_falls_back_to_the_next_model():
+    broken, healthy = provider(), provider()
+    chain = make_chain(broken, healthy)
+    chain.models[0] = OffSchemaModel(broken, "model-0", "summarizer")
+
+    result = chain.with_structured_output(Summary).invoke(MESSAGES)
+
+    assert isinstance(result, Summary)
+    assert chain.healthy_model == "model-1"
+
+
+@pytest.mark.parametrize("percentile", [0, 1, 95, -0.5])
+def test_rejects_hedge_percentile_outside_unit_interval(percentile):
+    with pytest.raises(ValueError):
+        make_chain(provider(), hedge_percentile=percentile)
+
+
+def hedged_chain(slow: SimulatedProvider, fast: SimulatedProvider) -> ModelChain:
+    chain = make_chain(slow, fast, hedge_percentile=0.9)
+    for _ in range(20):
+        chain.latency.record(0.01)
+    return chain
+
+
+def test_slow_call_is_hedged_to_the_next_model():
+    slow, fast = provider(median=0.5), provider(median=0.001)
+    chain = hedged_chain(slow, fast)
+
+    started = time.monotonic()
+    asyncio.run(chain.ainvoke(MESSAGES))
+    assert time.monotonic() - started < 0.3
+    assert fast.calls["summarizer"] == 1
+
+    started = time.monotonic()
+    chain.invoke(MESSAGES)
+    assert time.monotonic() - started < 0.4
+    assert fast.calls["summarizer"] == 2
+
+
+def test_hedged_share_is_capped():
+    slow, fast = provider(median=0.05), provider(median=0.001)
+    chain = hedged_chain(slow, fast)
+
+    async def calls():
+        for _ in range(HEDGE_BURST + 2):
+            await chain.ainvoke(MESSAGES)
+    asyncio.run(calls())
+
+    # the saved up hedges are spent, later slow calls wait for the first model
+    assert fast.calls["summarizer"] == HEDGE_BURST
+    assert slow.calls["summarizer"] == HEDGE_BURST + 2
@@ -0,0 +1,84 @@
+from deep_research import tavily
+from deep_research.parsing import loads_tolerant, parse_structured, tolerant_structured_output
+from deep_research.research_state import LLMOutput, Summary
+from deep_research.state_multi_agent_supervisor import SupervisorOutput
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import AIMessage
+import pytest
+
+
+def test_loads_tolerant_repairs_fenced_truncated_json():
+    text = '<think>plan</think>\n```json\n{"message": "go", "tool_calls": [{"name": "a", "args": {"q": "x"}},'
+    assert loads_tolerant(text) == {"message": "go", "tool_calls": [{"name": "a", "args": {"q": "x"}}]}
+
+
+def test_parse_structured_coerces_field_types():
+    summary = parse_structured('{"summary": "s", "key_excerpts": ["a", "b"]}', Summary)
+    assert summary == Summary(summary="s", key_excerpts="a\nb")
+
+
+def test_bare_tool_call_becomes_supervisor_tool_call():
+    output = parse_structured('{"name": "ConductResearch", "arguments": {"research_topic": "coffee prices"}}', SupervisorOutput)
+    assert [(call["name"], call["args"]) for call in output.tool_calls] == [("ConductResearch", {"research_topic": "coffee prices"})]
+
+
+def test_tool_call_to_other_tool_in_raw_reply_is_kept():
+    raw = AIMessage(content="", tool_calls=[{"name": "ConductResearch", "args": {"research_topic": "tea"}, "id": "1"}])
+    output = tolerant_structured_output(SupervisorOutput)({"raw": raw, "parsed": None, "parsing_error": ValueError()})
+    assert output.tool_calls[0]["name"] == "ConductResearch"
+    assert output.tool_calls[0]["args"] == {"research_topic": "tea"}
+
+
+def test_call_named_after_schema_is_unwrapped():
+    output = parse_structured('{"name": "SupervisorOutput", "arguments": {"message": "done", "tool_calls": []}}', SupervisorOutput)
+    assert output == SupervisorOutput(message="done", tool_calls=[])
+
+
+@pytest.mark.parametrize("payload, schema", [
+    ('{"text": "an answer in the wrong shape"}', Summary),
+    ('{"summary": "only half of it"}', Summary),
+    ('{}', LLMOutput),
+    ('no json at all', SupervisorOutput),
+])
+def test_off_schema_output_raises(payload, schema):
+    with pytest.raises(OutputParserException):
+        parse_structured(payload, schema)
+
+
+class OffSchemaSummarizer:
+    """Summarization model whose reply can not be repaired into a Summary"""
+
+    def with_structured_output(self, schema, **kwargs):
+        return self
+
+    def invoke(self, input, config=None, **kwargs):
+        raw = AIMessage(content='{"text": "an answer in the wrong shape"}')
+        return tolerant_structured_output(Summary)({"raw": raw, "parsed": None, "parsing_error": ValueError()})
+
+
+def test_off_schema_summary_falls_back_without_caching(monkeypatch):
+    monkeypatch.setattr(tavily, "summary_model", OffSchemaSummarizer())
+    monkeypatch.setattr(tavily, "summary_cache", tavily.ResultCache())
+    page = "Coffee prices rose sharply this year. " * 40
+
+    summary = tavily.summarize_webpage_content(page, "coffee prices")
+
+    assert summary.strip()
+    assert "<summary>\n\n</summary>" not in summary
+    assert tavily.summary_cache.get(tavily.content_hash(page)) is None
+
+
+class EmptySummarizer(OffSchemaSummarizer):
+    def invoke(self, input, config=None, **kwargs):
+        return Summary(summary="", key_excerpts="")
+
+
+def test_empty_summary_is_not_cached(monkeypatch):
+    monkeypatch.setattr(tavily, "summary_model", EmptySummarizer())
+    monkeypatch.setattr(tavily, "summary_cache", tavily.ResultCache())
+    page = "Tea harvests were smaller this year. " * 40
+
+    summary = tavily.summarize_webpage_content(page, "tea harvest")
+
+    assert summary.strip()
+    assert tavily.summary_cache.get(tavily.content_hash(page)) is None
@@ -0,0 +1,60 @@
+from deep_research import tavily
+from collections import Counter
+import pytest
+
+
+class CountingClient:
+    def __init__(self):
+        self.queries = []
+
+    def search(self, query, max_results=3, topic='general', include_raw_content=True, **kwargs):
+        self.queries.append(query)
+        return {"query": query, "results": [
+            {"url": f"https://example.com/{len(self.queries)}", "title": query, "content": query, "raw_content": None, "score": 0.9}
+        ]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = CountingClient()
+    monkeypatch.setattr(tavily, "tavily_client", client)
+    monkeypatch.setattr(tavily, "prefetched_searches", tavily.ResultCache())
+    monkeypatch.setattr(tavily, "prefetch_stats", Counter())
+    return client
+
+
+def test_speculative_query_is_the_topic_opening():
+    topic = "Investigate the effect of 2024 tariffs on coffee importers in the EU. Cover prices and volumes."
+    assert tavily.speculative_queries(topic) == ["Investigate the effect of 2024 tariffs on coffee importers in the EU"]
+
+
+def test_prefetch_serves_a_similar_first_query_once(client):
+    with tavily.use_prefetch_run("run-1"):
+        tavily.prefetch_search("effect of 2024 tariffs on coffee importers in the EU")
+        first = tavily.tavily_search_query("2024 tariffs effect on EU coffee importers")
+        second = tavily.tavily_search_query("2024 tariffs effect on EU coffee importers")
+
+    assert client.queries == ["effect of 2024 tariffs on coffee importers in the EU", "2024 tariffs effect on EU coffee importers"]
+    assert first["query"] == "effect of 2024 tariffs on coffee importers in the EU"
+    assert second["query"] == "2024 tariffs effect on EU coffee importers"
+    assert tavily.prefetch_hit_rate() == 1.0
+
+
+def test_prefetch_is_not_used_for_other_queries_or_runs(client):
+    with tavily.use_prefetch_run("run-1"):
+        tavily.prefetch_search("effect of 2024 tariffs on coffee importers in the EU")
+        tavily.tavily_search_query("history of coffee cultivation in Ethiopia")
+    with tavily.use_prefetch_run("run-2"):
+        tavily.tavily_search_query("effect of 2024 tariffs on coffee importers in the EU")
+    tavily.tavily_search_query("effect of 2024 tariffs on coffee importers in the EU")
+    tavily.release_prefetched_searches("run-1")
+
+    assert len(client.queries) == 4
+    assert tavily.prefetch_stats == Counter(started=1, unused=1)
+    assert tavily.prefetch_hit_rate() == 0.0
+
+
+def test_nothing_is_prefetched_outside_a_run(client):
+    tavily.prefetch_search("coffee tariffs")
+    assert client.queries == []
+    assert tavily.prefetch_hit_rate() is None
@@ -0,0 +1,46 @@
+from deep_research.tavily import format_search_output, trim_to_tokens, trim_suffix
+from deep_research.utils import estimate_tokens
+
+
+def results(*lengths: int) -> dict:
+    """Search results with summaries of about `length` tokens each, best ranked first"""
+    return {
+        f"https://example.com/{i}": {
+            "title": f"Source {i}",
+            "content": " ".join(f"w{i}x" for _ in range(length)),
+            "score": 1 - i / 10,
+        }
+        for i, length in enumerate(lengths)
+    }
+
+
+def test_trim_marker_counts_towards_budget():
+    trimmed = trim_to_tokens("word " * 400, 50)
+    assert trimmed.endswith(trim_suffix)
+    assert estimate_tokens(trimmed) <= 50
+
+
+def test_output_fits_budget():
+    for budget in (300, 600, 900, 1500):
+        assert estimate_tokens(format_search_output(results(500, 500, 500), max_tokens=budget)) <= budget
+
+
+def test_lower_ranked_sources_are_cut_before_the_best_one():
+    output = format_search_output(results(400, 400, 400), max_tokens=700)
+    first, rest = output.split("--- SOURCE 2", 1)
+    assert trim_suffix not in first
+    assert trim_suffix in rest or "omitted" in rest
+
+
+def test_lower_ranked_sources_are_dropped_before_trimming_the_best_one():
+    output = format_search_output(results(400, 400, 400), max_tokens=480)
+    assert "SOURCE 2" not in output
+    assert "2 lower ranked source(s) omitted" in output
+    assert trim_suffix not in output
+
+
+def test_best_source_is_trimmed_when_it_does_not_fit_alone():
+    output = format_search_output(results(800, 400), max_tokens=500)
+    assert trim_suffix in output
+    assert "1 lower ranked source(s) omitted" in output
+    assert estimate_tokens(output) <= 500
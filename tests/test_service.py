@@ -0,0 +1,168 @@
+from deep_research import service
+from deep_research.service import Job, ResearchApp, ResearchService
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+import asyncio
+import json
+import pytest
+
+
+class FakeScope:
+    async def ainvoke(self, state):
+        query = state["messages"][-1].content
+        if "?" in query:
+            return {"messages": state["messages"] + [AIMessage(content="Which region?")]}
+        return {"messages": state["messages"], "research_brief": f"Brief: {query}"}
+
+
+class FakeSupervisor:
+    """Streams the updates of one ConductResearch round, `delay` seconds apart"""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+
+    async def astream(self, state, stream_mode=None):
+        call = {"name": "ConductResearch", "args": {"research_topic": state["research_brief"]}, "id": "call-1"}
+        yield "updates", {"supervisor": {"supervisor_messages": [AIMessage(content="", tool_calls=[call])]}}
+        await asyncio.sleep(self.delay)
+        yield "updates", {"supervisor_tools": {"supervisor_messages": [ToolMessage(content="findings", name="ConductResearch", tool_call_id="call-1")]}}
+        yield "values", {"notes": ["findings"], "raw_notes": ["raw"]}
+
+
+@pytest.fixture
+def fake_graphs(monkeypatch):
+    supervisor = FakeSupervisor()
+    monkeypatch.setattr(service, "scope_research", FakeScope())
+    monkeypatch.setattr(service, "supervisor_agent", supervisor)
+    return supervisor
+
+
+async def request(app, method: str, path: str, body: dict = None) -> tuple[int, dict]:
+    """Send one HTTP request to the ASGI app, returns the status and decoded JSON body"""
+    incoming = [{"type": "http.request", "body": json.dumps(body).encode() if body is not None else b"", "more_body": False}]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0) if incoming else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "http", "method": method, "path": path}, receive, send)
+    return sent[0]["status"], json.loads(b"".join(message.get("body", b"") for message in sent[1:]) or b"{}")
+
+
+async def wait_finished(job: Job, timeout: float = 2):
+    async with asyncio.timeout(timeout):
+        while not job.finished:
+            await asyncio.sleep(0.01)
+
+
+def test_job_runs_to_done(fake_graphs):
+    async def scenario():
+        app = ResearchApp(ResearchService(max_concurrent=1, max_queued=2))
+        await app.service.start()
+        try:
+            status, body = await request(app, "POST", "/jobs", {"query": "coffee prices", "budget": {"max_search_calls": 5}})
+            assert status == 202
+            job = app.service.jobs[body["job_id"]]
+            await wait_finished(job)
+            status, body = await request(app, "GET", f"/jobs/{job.id}")
+            return status, body, [event["event"] for event in job.events]
+        finally:
+            await app.service.stop()
+
+    status, body, events = asyncio.run(scenario())
+    assert status == 200
+    assert body["status"] == "done"
+    assert body["result"]["notes"] == ["findings"]
+    assert events.count("progress") == 2
+    assert events[-1] == "budget"
+
+
+def test_job_needing_clarification(fake_graphs):
+    async def scenario():
+        svc = ResearchService(max_concurrent=1, max_queued=2)
+        await svc.start()
+        try:
+            job = svc.submit(Job([HumanMessage(content="coffee?")]))
+            await wait_finished(job)
+            return job
+        finally:
+            await svc.stop()
+
+    job = asyncio.run(scenario())
+    assert job.status == "needs_clarification"
+    assert job.result == {"clarification": "Which region?"}
+
+
+def test_cancel_before_task_starts(fake_graphs):
+    async def scenario():
+        svc = ResearchService(max_concurrent=1, max_queued=2)
+        await svc.start()
+        try:
+            job = svc.submit(Job([HumanMessage(content="coffee prices")]))
+            # let the worker take the job and create its task, but not run it yet
+            while job.task is None:
+                await asyncio.sleep(0)
+            assert job.status == "queued"
+            svc.cancel(job)
+            await wait_finished(job)
+            return job
+        finally:
+            await svc.stop()
+
+    assert asyncio.run(scenario()).status == "cancelled"
+
+
+def test_cancel_running_job(fake_graphs):
+    fake_graphs.delay = 10
+
+    async def scenario():
+        svc = ResearchService(max_concurrent=1, max_queued=2)
+        await svc.start()
+        try:
+            job = svc.submit(Job([HumanMessage(content="coffee prices")]))
+            while job.status != "running":
+                await asyncio.sleep(0.01)
+            svc.cancel(job)
+            await wait_finished(job)
+            return job, svc.running
+        finally:
+            await svc.stop()
+
+    job, running = asyncio.run(scenario())
+    assert job.status == "cancelled"
+    assert running == 0
+
+
+def test_full_queue_is_rejected(fake_graphs):
+    async def scenario():
+        app = ResearchApp(ResearchService(max_concurrent=1, max_queued=1))
+        # workers are not started, so submitted jobs stay queued
+        app.service._queue = asyncio.Queue(maxsize=1)
+        first, _ = await request(app, "POST", "/jobs", {"query": "coffee"})
+        second, body = await request(app, "POST", "/jobs", {"query": "tea"})
+        return first, second, body
+
+    first, second, body = asyncio.run(scenario())
+    assert (first, second) == (202, 429)
+    assert "saturated" in body["error"]
+
+
+@pytest.mark.parametrize("budget", [
+    {"max_seconds": "ten"},
+    {"max_tokens": -5},
+    {"max_search_calls": True},
+    {"max_seconds": [60]},
+    {"max_cost": 3},
+    "600",
+])
+def test_invalid_budget_is_rejected(fake_graphs, budget):
+    async def scenario():
+        app = ResearchApp(ResearchService(max_concurrent=1, max_queued=2))
+        app.service._queue = asyncio.Queue(maxsize=2)
+        return await request(app, "POST", "/jobs", {"query": "coffee", "budget": budget})
+
+    status, body = asyncio.run(scenario())
+    assert status == 400
+    assert "budget" in body["error"].lower()
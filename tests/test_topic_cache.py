@@ -0,0 +1,39 @@
+from deep_research import research_supervisor
+from deep_research.budget import RunBudget, use_run_budget
+from deep_research.topic_cache import TopicCache
+import asyncio
+
+
+def make_cache() -> TopicCache:
+    return TopicCache(path=':memory:', similarity_threshold=0.5)
+
+
+def test_near_match_requires_same_numbers():
+    cache = make_cache()
+    cache.put("global coffee production forecast 2023", {"compressed_research": "2023 findings", "raw_notes": []})
+
+    assert cache.get("coffee production forecast global 2023")["compressed_research"] == "2023 findings"
+    assert cache.get("global coffee production forecasts for 2023")["compressed_research"] == "2023 findings"
+    assert cache.get("global coffee production forecast 2024") is None
+
+
+def test_degraded_results_are_not_cached(monkeypatch):
+    cache = make_cache()
+    monkeypatch.setattr(research_supervisor, "get_topic_cache", lambda: cache)
+
+    async def dispatch(job_id, research_topic):
+        return {"compressed_research": f"findings on {research_topic}", "raw_notes": []}
+    monkeypatch.setattr(research_supervisor, "dispatch_research_agent", dispatch)
+
+    async def run(topic, budget):
+        with use_run_budget(budget):
+            return await research_supervisor.run_cached_research_agent("job", topic, use_topic_cache=True)
+
+    exhausted = RunBudget(max_search_calls=10)
+    exhausted.charge_search(8)
+    result = asyncio.run(run("coffee tariffs", exhausted))
+    assert result["degraded"]
+    assert cache.get("coffee tariffs") is None
+
+    asyncio.run(run("coffee tariffs", RunBudget(max_search_calls=10)))
+    assert cache.get("coffee tariffs") is not None